@@ -0,0 +1,215 @@
+"""
+Симулятор хаба для запуска и замера миссий v1.py на компьютере
+
+Подменяет модули pybricks.* (хаб, гироскоп, моторы, датчики цвета, wait)
+моделью мира с виртуальными часами, поэтому миссия выполняется быстрее
+реального времени и без робота.
+
+Пример:
+    import sim
+    program = sim.load()            # sim.install() + import v1
+    report = sim.run_mission(program, 3)
+    print(report.format())
+
+Из консоли:
+    python -m sim 3
+"""
+
+import functools
+import importlib.util
+import inspect
+import os
+import sys
+import time
+
+from . import devices
+from .world import Field, RobotConfig, World
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install(world=None):
+    """Регистрирует симулированные pybricks.* и возвращает мир"""
+    return devices.install(world or World())
+
+
+def load(path=None, world=None, name="v1"):
+    """Устанавливает симулятор и импортирует программу робота"""
+    if name in sys.modules and world is None and devices._world is not None:
+        return sys.modules[name]
+    install(world)
+    path = path or os.path.join(ROOT, name + ".py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Report:
+    """Итог одного прогона миссии (время в мс симуляции)"""
+
+    def __init__(self, mission):
+        self.mission = mission
+        self.steps = []
+        self.duration = 0
+        self.pose = None
+        self.stopped = False
+        self.error = None
+        self.calls = {}
+        self.wall = 0.0
+
+    def format(self):
+        lines = ["Миссия %s: %d мс" % (self.mission, self.duration)]
+        if self.stopped:
+            lines[0] += " (остановлена)"
+        if self.error:
+            lines[0] += " (ошибка: %s)" % self.error
+        for step in self.steps:
+            lines.append("  %7d  %6d мс  %s(%s)" % (
+                step["start"], step["duration"], step["name"], step["args"]))
+        x, y, heading = self.pose
+        lines.append("Поза: x=%.0f мм, y=%.0f мм, курс=%.1f°" % (x, y, heading))
+        return "\n".join(lines)
+
+
+def _format_args(args, kwargs):
+    parts = [_short(a) for a in args]
+    parts += ["%s=%s" % (k, _short(v)) for k, v in kwargs.items()]
+    return ", ".join(parts)
+
+
+def _short(value):
+    if isinstance(value, float):
+        return "%g" % value
+    if hasattr(value, "_state"):
+        return "motor"
+    if hasattr(value, "_port"):
+        return "sensor_" + value._port
+    if type(value).__name__ == "Task":
+        return "task"
+    if isinstance(value, tuple) and value and value[0] in ("straight", "back", "turn"):
+        # Сегмент пути: вид, дистанция, поворот
+        if value[0] == "turn":
+            return "turn %g" % value[2]
+        if value[2]:
+            return "%s %g/%g°" % (value[0], value[1], value[2])
+        return "%s %g" % (value[0], value[1])
+    return repr(value)
+
+
+def _step_functions(program):
+    """Функции и примитивы программы, вызовы которых из миссии - шаги"""
+    names = ["wait"]
+    primitive = getattr(program, "Primitive", ())
+    for name, value in vars(program).items():
+        if name.startswith(("mission", "_")) or name in ("launch", "execute", "check_stop", "cancel_all"):
+            continue
+        if isinstance(value, primitive) or \
+                inspect.isfunction(value) and value.__module__ == program.__name__:
+            names.append(name)
+    return names
+
+
+class _TimedPrimitive:
+    """Замеряемая обёртка примитива; остаётся пригодной для start(...)"""
+
+    def __init__(self, name, primitive, step):
+        self.name = name
+        self.gen = primitive.gen
+        self._step = step
+
+    def __call__(self, *args, **kwargs):
+        return self._step(*args, **kwargs)
+
+    def __repr__(self):
+        return self.name
+
+
+def run_mission(program, number, start_pose=None, presses=(), mission=None, blocks=()):
+    """
+    Выполняет mission_N в симуляторе
+
+    Args:
+        program: Модуль программы (sim.load())
+        number: Номер миссии (1..8)
+        start_pose: (x мм, y мм, курс °) старта
+        presses: [(кнопки, с какой мс, сколько мс)] - нажатия во время миссии
+        mission: Выполнить это (таблицу или функцию) вместо mission_N
+        blocks: [(порт, угол)] - упоры навесных моторов (World.block)
+
+    Returns:
+        Report с длительностью, позой и временем каждого шага
+    """
+    world = devices.world()
+    world.reset(start_pose)
+    for buttons, at_ms, duration_ms in presses:
+        world.press(buttons, at_ms, duration_ms)
+    for port, angle in blocks:
+        world.block(port, angle)
+
+    report = Report(number)
+    depth = [0]
+    recording = [False]  # шаги - только вызовы из тела миссии, не подготовка launch()
+    originals = {}
+
+    def wrap(name, func):
+        @functools.wraps(getattr(func, "gen", func))
+        def step(*args, **kwargs):
+            if depth[0] or not recording[0]:
+                return func(*args, **kwargs)
+            depth[0] += 1
+            start = world.now_us
+            try:
+                return func(*args, **kwargs)
+            finally:
+                depth[0] -= 1
+                # Вспомогательные функции без движения (сегменты пути) - не шаги
+                if world.now_us > start or hasattr(func, "gen") or name == "start":
+                    report.steps.append({
+                        "name": name,
+                        "args": _format_args(args, kwargs),
+                        "call": (args, kwargs),
+                        "start": start // 1000,
+                        "duration": (world.now_us - start) // 1000,
+                    })
+        if hasattr(func, "gen"):
+            return _TimedPrimitive(name, func, step)
+        return step
+
+    for name in _step_functions(program):
+        originals[name] = getattr(program, name)
+        setattr(program, name, wrap(name, originals[name]))
+
+    body = mission if mission is not None else program.missions[number - 1]
+
+    def record():
+        # launch() сам ставит позу, читает батарею и ждёт фоновые задачи -
+        # это не шаги миссии (иначе optimize/tune допишут их в таблицу)
+        recording[0] = True
+        try:
+            if callable(body):
+                body()
+            else:
+                program.execute(body)
+        finally:
+            recording[0] = False
+
+    started = time.perf_counter()
+    try:
+        program.launch(record)
+    except program.StopMission:
+        report.stopped = True
+    except Exception as e:
+        report.error = "%s: %s" % (type(e).__name__, e)
+    finally:
+        for name, func in originals.items():
+            setattr(program, name, func)
+
+    report.wall = time.perf_counter() - started
+    report.duration = world.time_ms()
+    # Поза - где робот остановился, а не где закончилась миссия
+    world.settle()
+    report.pose = world.pose()
+    report.calls = dict(world.calls)
+    return report
@@ -0,0 +1,67 @@
+"""
+Запуск миссии в симуляторе из консоли
+
+    python -m sim 3                 # отчёт по шагам
+    python -m sim 3 --runs 1000     # скорость симуляции
+    python -m sim 3 --field mat.pgm --line 300,100,300,900
+    python -m sim 3 --dump > run.txt   # трасса для python -m sim.analyze
+    python -m sim 3 --block B:40    # рука на порту B упирается через 40°
+    python -m sim 3 --battery 7400  # подсевшая батарея, мВ
+    python -m sim 1 --grip 1500     # скользкое поле: колёса буксуют на разгоне
+"""
+
+import argparse
+
+from . import Field, World, load, run_mission
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim", description="Прогон миссии в симуляторе")
+    parser.add_argument("mission", type=int, help="номер миссии (1..8)")
+    parser.add_argument("--runs", type=int, default=1, help="сколько раз прогнать")
+    parser.add_argument("--start", default="200,200,0", help="x,y,курс старта (мм, мм, °)")
+    parser.add_argument("--field", help="растр поля в PGM")
+    parser.add_argument("--line", action="append", default=[],
+                        help="чёрная линия x1,y1,x2,y2 (мм), можно несколько")
+    parser.add_argument("--block", action="append", default=[],
+                        help="упор мотора ПОРТ:угол (например B:40), можно несколько")
+    parser.add_argument("--battery", type=float, help="напряжение батареи в начале миссии, мВ")
+    parser.add_argument("--drain", type=float, default=0.0, help="разряд батареи за миссию, мВ/с")
+    parser.add_argument("--grip", type=float, help="сцепление колёс, мм/с² (по умолчанию не буксуют)")
+    parser.add_argument("--no-cost", action="store_true", help="не учитывать время вызовов API")
+    parser.add_argument("--dump", action="store_true", help="напечатать трассу телеметрии последнего прогона")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    field = Field.from_pgm(args.field) if args.field else Field()
+    for line in args.line:
+        field.draw_line(*[float(v) for v in line.split(",")])
+    world = World(field=field, call_costs=not args.no_cost)
+    if args.battery:
+        world.config.battery_voltage = args.battery
+    world.config.battery_drain = args.drain
+    world.config.grip_accel = args.grip
+    program = load(world=world)
+    start = tuple(float(v) for v in args.start.split(","))
+    blocks = [(port, float(angle)) for port, angle in (block.split(":") for block in args.block)]
+    if args.dump:
+        # На компьютере памяти хватает: вся миссия, каждый такт
+        program.telemetry = program.Telemetry(size=60000, every=1)
+
+    wall = 0.0
+    for _ in range(args.runs):
+        report = run_mission(program, args.mission, start_pose=start, blocks=blocks)
+        wall += report.wall
+
+    print(report.format())
+    if args.dump:
+        program.telemetry.dump()
+    if wall > 0:
+        print("Симуляция: %d прогон(ов) за %.2f с, %.0fx быстрее реального времени" % (
+            args.runs, wall, report.duration * args.runs / 1000 / wall))
+
+
+if __name__ == "__main__":
+    main()
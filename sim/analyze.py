@@ -0,0 +1,216 @@
+"""
+Разбор трассы миссии (строки T/S/E/X из Telemetry.dump или TRACE)
+
+По каждому шагу: длительность, дрожание такта, перелёт курса на поворотах,
+ошибка остановки прямых против distance_degrees, боковая ошибка езды по
+линии, события (застревание rotate) и время в фазах разгона, крейсера и торможения. Два файла сравниваются по шагам - видно, какой шаг
+миссии стал медленнее.
+
+    python -m sim 3 --dump > before.txt
+    python -m sim.analyze before.txt
+    python -m sim.analyze before.txt after.txt
+"""
+
+import argparse
+
+PHASES = ("разгон", "крейсер", "торм.", "поворот")
+TURNS = ("gyro_turn", "turn_to", "gyro_turn_with_motor")
+STRAIGHTS = ("gyro_straight", "gyro_straight_accel", "gyro_back", "gyro_back_accel",
+             "gyro_straight_with_motor", "gyro_back_with_motor")
+LINES = ("follow_line",)
+STOP_WATCH = 400    # мс после шага - дольше докат не ждём (как BRAKE_WATCH_TIME)
+
+
+class Step:
+    """Один шаг миссии из трассы"""
+
+    def __init__(self, index, t, left, right, heading, name, args):
+        self.index = index
+        self.name = name
+        self.args = args
+        self.start = t
+        self.end = None
+        self.left = left
+        self.right = right
+        self.heading = heading
+        self.ticks = self.overruns = 0
+        self.jitter = None
+        self.rows = []
+        self.travel = None      # (левое, правое) там, где робот остановился после шага
+        self.overshoot = None
+        self.stop_error = None
+        self.line_error = None  # (средняя |ошибка|, наибольшая) по линии
+        self.events = []        # события X внутри шага: "rotate stalled 300 212"
+        self.phases = [0, 0, 0, 0]
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else self.start) - self.start
+
+
+def parse(lines):
+    """Строки трассы -> список Step; прочие строки игнорируются"""
+    steps = []
+    stack = []
+    rows = []
+    for line in lines:
+        parts = line.strip().split(",")
+        kind = parts[0]
+        if kind not in ("T", "S", "E", "X") or len(parts) < 5:
+            continue
+        try:
+            t, left, right, heading = [int(v) for v in parts[1:5]]
+        except ValueError:
+            continue
+        if kind == "T":
+            row = [int(v) for v in parts[1:]]
+            rows.append(row)
+            if stack:
+                stack[0].rows.append(row)
+        elif kind == "X":
+            if stack:
+                stack[0].events.append(" ".join(parts[5:]))
+        elif kind == "S":
+            step = Step(len(steps), t, left, right, heading / 10, parts[5], ",".join(parts[6:]))
+            if stack:
+                # Вложенный примитив (например, follow_path) - часть внешнего шага
+                stack.append(step)
+                continue
+            steps.append(step)
+            stack.append(step)
+        else:
+            step = stack.pop() if stack else None
+            if step is None or step.name != parts[5]:
+                continue
+            step.end = t
+            info = parts[6].split() if len(parts) > 6 else []
+            if len(info) == 5:
+                step.ticks, step.overruns = int(info[0]), int(info[1])
+                step.jitter = (int(info[2]), float(info[3]), int(info[4]))
+    for step in steps:
+        if step.end is not None:
+            step.travel = rest_position(rows, step.end)
+        measure(step)
+    return steps
+
+
+def rest_position(rows, end):
+    """
+    Углы колёс (левое, правое), где робот встал после шага
+    
+    Как watch_landing на хабе: докат ждём не дольше STOP_WATCH мс, и если
+    следующий шаг уже дал команды колёсам - докат не измерить (None).
+    Остановка - два такта подряд (не одна мс) с теми же углами энкодеров.
+    """
+    last = None
+    for row in rows:
+        if row[0] < end:
+            continue
+        if row[0] > end + STOP_WATCH or row[4] or row[5]:
+            return None
+        if last and row[0] > last[0] and row[1] == last[1] and row[2] == last[2]:
+            return row[1], row[2]
+        last = row
+    return None
+
+
+def measure(step):
+    """Метрики шага по его тактам"""
+    rows = step.rows
+    # Время в фазах: каждый такт до следующего
+    for a, b in zip(rows, rows[1:]):
+        phase = a[8]
+        if 1 <= phase <= 4:
+            step.phases[phase - 1] += b[0] - a[0]
+
+    if step.name in TURNS and rows:
+        target = rows[-1][9] / 10
+        direction = 1 if target >= step.heading else -1
+        beyond = max((r[3] / 10 - target) * direction for r in rows)
+        step.overshoot = max(0.0, beyond)
+
+    if step.name in LINES:
+        errors = [abs(r[10]) for r in rows if len(r) > 10]
+        if errors:
+            step.line_error = (sum(errors) / len(errors), max(errors))
+
+    if step.name in STRAIGHTS and step.travel:
+        try:
+            distance = abs(float(step.args.split()[0]))
+        except (IndexError, ValueError):
+            return
+        # Энкодеры не обнуляются: путь - разница с началом шага
+        left = abs(step.travel[0] - step.left)
+        right = abs(step.travel[1] - step.right)
+        step.stop_error = (left + right) / 2 - distance
+
+
+def load(path):
+    with open(path) as f:
+        return parse(f)
+
+
+def format_step(step):
+    jitter = "%d/%.1f/%d" % step.jitter if step.jitter else "-"
+    extra = []
+    if step.overshoot is not None:
+        extra.append("перелёт %.1f°" % step.overshoot)
+    if step.stop_error is not None:
+        extra.append("остановка %+.0f°" % step.stop_error)
+    if step.line_error is not None:
+        extra.append("линия %.1f/%d" % step.line_error)
+    extra += step.events
+    phases = " ".join("%s %d" % (name, ms) for name, ms in zip(PHASES, step.phases) if ms)
+    if phases:
+        extra.append(phases)
+    return "%3d %6d %6d мс  %-24s %-14s %3d/%-3d %s" % (
+        step.index + 1, step.start, step.duration, step.name, jitter,
+        step.ticks, step.overruns, "  ".join(extra))
+
+
+def report(steps):
+    lines = ["  # начало  длит.     шаг                      jitter мин/ср/макс такты/опозд."]
+    lines += [format_step(step) for step in steps]
+    total = sum(step.duration for step in steps)
+    overruns = sum(step.overruns for step in steps)
+    lines.append("Итого: %d шагов, %d мс, опозданий такта %d" % (len(steps), total, overruns))
+    return "\n".join(lines)
+
+
+def compare(before, after, threshold=20):
+    """Сравнение двух прогонов по номерам шагов; '<<' - шаг медленнее на threshold мс"""
+    lines = ["  # шаг                      было    стало   разница"]
+    for i in range(max(len(before), len(after))):
+        a = before[i] if i < len(before) else None
+        b = after[i] if i < len(after) else None
+        name = (b or a).name
+        if a and b and a.name != b.name:
+            name = "%s -> %s" % (a.name, b.name)
+        was = a.duration if a else 0
+        now = b.duration if b else 0
+        mark = "  <<" if now - was >= threshold else ""
+        lines.append("%3d %-24s %6d %8d %+9d%s" % (i + 1, name, was, now, now - was, mark))
+    total_a = sum(s.duration for s in before)
+    total_b = sum(s.duration for s in after)
+    lines.append("Итого: %d -> %d мс (%+d)" % (total_a, total_b, total_b - total_a))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.analyze", description="Разбор трассы миссии")
+    parser.add_argument("trace", help="файл трассы (вывод dump)")
+    parser.add_argument("other", nargs="?", help="второй прогон для сравнения")
+    parser.add_argument("--threshold", type=int, default=20, help="порог замедления шага, мс")
+    args = parser.parse_args(argv)
+
+    steps = load(args.trace)
+    print(report(steps))
+    if args.other:
+        print()
+        print(report(load(args.other)))
+        print()
+        print(compare(steps, load(args.other), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
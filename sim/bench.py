@@ -0,0 +1,113 @@
+"""
+Микробенчмарки на симуляторе: сколько стоит один такт цикла управления
+
+Стоимость на хабе оценивается по вызовам API (World.CALL_COST_US), время
+интерпретатора - по времени на компьютере (только для сравнения "до/после").
+
+    python -m sim.bench             # все
+    python -m sim.bench stop telemetry
+    python -m sim.bench profile_float profile_table
+"""
+
+import argparse
+import time
+
+from . import devices, load
+
+
+def per_tick(program, body, ticks=5000):
+    """
+    Вызывает body() раз в такт (LOOP_PERIOD) и меряет стоимость вызова
+
+    Returns:
+        {"us": мкс API на такт, "host_us": мкс компьютера на такт,
+         "calls": {вызов API: штук на такт}}
+    """
+    world = devices.world()
+    world.reset()
+    before = dict(world.calls)
+    cost = 0
+    host = 0.0
+    for _ in range(ticks):
+        start = world.now_us
+        started = time.perf_counter()
+        body()
+        host += time.perf_counter() - started
+        cost += world.now_us - start
+        world.advance(program.LOOP_PERIOD)
+    calls = {name: (count - before.get(name, 0)) / ticks
+             for name, count in world.calls.items() if count != before.get(name, 0)}
+    return {"us": cost / ticks, "host_us": host / ticks * 1e6, "calls": calls}
+
+
+def format_result(name, result):
+    calls = ", ".join("%s %.2f" % item for item in sorted(result["calls"].items()))
+    return "%-12s %7.1f мкс API/такт  %6.2f мкс ПК/такт  [%s]" % (
+        name, result["us"], result["host_us"], calls or "нет вызовов")
+
+
+def bench_stop(program):
+    """Проверка кнопки остановки в каждом такте"""
+    return per_tick(program, program.check_stop)
+
+
+def bench_telemetry(program):
+    """Запись такта в буфер телеметрии"""
+    telemetry = program.telemetry or program.Telemetry()
+    telemetry.start()
+    return per_tick(program, telemetry.record)
+
+
+# Профиль прямой для сравнения (как первая прямая mission_1)
+PROFILE = (1400, 200, 300, 100, 1000, 80)
+
+
+def _progress_body(speed):
+    """Тело такта: скорость профиля в точке пути, путь растёт на ~5° за такт"""
+    state = [0]
+
+    def body():
+        state[0] = (state[0] + 5) % PROFILE[0]
+        speed(state[0])
+    return body
+
+
+def bench_profile_float(program):
+    """Трапеция формулой в каждом такте (как было: get_trapezoid_speed + map_value)
+
+    На ПК float дешёвый, поэтому разница с таблицей мала; на хабе каждая
+    операция с float выделяет память - там мерит v1.bench_profile (BENCHMARK).
+    """
+    distance, accel, decel, min_speed, max_speed, end_speed = PROFILE
+    return per_tick(program, _progress_body(lambda progress: program.get_trapezoid_speed(
+        progress, distance, accel, decel, min_speed, max_speed, end_speed)))
+
+
+def bench_profile_table(program):
+    """Та же трапеция из таблицы SpeedTable (целочисленная интерполяция)"""
+    table = program.compile_profile(*PROFILE)
+    return per_tick(program, _progress_body(table.speed))
+
+
+BENCHES = {
+    "stop": bench_stop,
+    "telemetry": bench_telemetry,
+    "profile_float": bench_profile_float,
+    "profile_table": bench_profile_table,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.bench", description="Стоимость такта в симуляторе")
+    parser.add_argument("bench", nargs="*", help="что мерить: %s (по умолчанию всё)" % ", ".join(sorted(BENCHES)))
+    args = parser.parse_args(argv)
+    for name in args.bench:
+        if name not in BENCHES:
+            parser.error("нет бенчмарка %r" % name)
+    program = load()
+    for name in args.bench or sorted(BENCHES):
+        print(format_result(name, BENCHES[name](program)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Подмена API Pybricks поверх модели мира
+
+Классы повторяют интерфейс pybricks (только то, что нужно нашим программам).
+Все устройства работают с одним миром, который задаётся через install().
+"""
+
+import math
+import struct
+import sys
+import types
+
+_world = None
+
+
+def world():
+    if _world is None:
+        raise RuntimeError("Симулятор не установлен: вызовите sim.install()")
+    return _world
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         pybricks.parameters
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Port:
+    A = "A"
+    B = "B"
+    C = "C"
+    D = "D"
+    E = "E"
+    F = "F"
+
+
+class Direction:
+    CLOCKWISE = "clockwise"
+    COUNTERCLOCKWISE = "counterclockwise"
+
+
+class Button:
+    LEFT = "left"
+    RIGHT = "right"
+    CENTER = "center"
+    BLUETOOTH = "bluetooth"
+
+
+class Color:
+    NONE = "none"
+    BLACK = "black"
+    WHITE = "white"
+    RED = "red"
+    ORANGE = "orange"
+    YELLOW = "yellow"
+    GREEN = "green"
+    CYAN = "cyan"
+    BLUE = "blue"
+    VIOLET = "violet"
+    MAGENTA = "magenta"
+
+
+class Axis:
+    X = "x"
+    Y = "y"
+    Z = "z"
+
+
+class Stop:
+    COAST = "coast"
+    BRAKE = "brake"
+    HOLD = "hold"
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         pybricks.tools
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def wait(time):
+    world().advance(time)
+
+
+class StopWatch:
+    def __init__(self):
+        self._start = world().now_us
+        self._paused_at = None
+
+    def time(self):
+        w = world()
+        w.charge("stopwatch.time")
+        now = self._paused_at if self._paused_at is not None else w.now_us
+        return (now - self._start) // 1000
+
+    def reset(self):
+        self._start = world().now_us
+        if self._paused_at is not None:
+            self._paused_at = self._start
+
+    def pause(self):
+        if self._paused_at is None:
+            self._paused_at = world().now_us
+
+    def resume(self):
+        if self._paused_at is not None:
+            self._start += world().now_us - self._paused_at
+            self._paused_at = None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         pybricks.hubs
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _System:
+    def set_stop_button(self, button):
+        pass
+
+    def storage(self, offset, read=None, write=None):
+        memory = world().storage
+        if write is not None:
+            memory[offset:offset + len(write)] = write
+            return None
+        return bytes(memory[offset:offset + read])
+
+
+class _Battery:
+    def voltage(self):
+        w = world()
+        w.charge("battery.voltage")
+        return int(w.battery_voltage())
+
+
+class _IMU:
+    def heading(self):
+        w = world()
+        w.charge("imu.heading")
+        return w.heading()
+
+    def reset_heading(self, angle):
+        world().reset_heading(angle)
+
+    def angular_velocity(self, axis=None):
+        w = world()
+        w.charge("imu.angular_velocity")
+        rate = w.angular_velocity_z()
+        if axis is None:
+            return (0.0, 0.0, rate)
+        return rate if axis == Axis.Z else 0.0
+
+    def acceleration(self, axis=None):
+        w = world()
+        w.charge("imu.acceleration")
+        forward = w.acceleration_x()
+        if axis is None:
+            return (forward, 0.0, 9810.0)
+        return {Axis.X: forward, Axis.Z: 9810.0}.get(axis, 0.0)
+
+
+class _Buttons:
+    def pressed(self):
+        w = world()
+        w.charge("buttons.pressed")
+        return w.pressed()
+
+
+class _Display:
+    def char(self, char):
+        pass
+
+    def number(self, number):
+        pass
+
+    def text(self, text, on=500, off=50):
+        pass
+
+    def pixel(self, row, column, brightness=100):
+        pass
+
+    def off(self):
+        pass
+
+
+class _Light:
+    def on(self, color):
+        pass
+
+    def off(self):
+        pass
+
+
+class _Speaker:
+    def beep(self, frequency=500, duration=100):
+        world().advance(duration)
+
+
+class PrimeHub:
+    def __init__(self, top_side=Axis.Z, front_side=Axis.X):
+        world()
+        self.system = _System()
+        self.battery = _Battery()
+        self.imu = _IMU()
+        self.buttons = _Buttons()
+        self.display = _Display()
+        self.light = _Light()
+        self.speaker = _Speaker()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         pybricks.pupdevices
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Motor:
+    def __init__(self, port, positive_direction=Direction.CLOCKWISE, gears=None, reset_angle=True):
+        self._state = world().motor(port)
+        self._sign = 1 if positive_direction == Direction.CLOCKWISE else -1
+        self._offset = 0.0
+
+    def angle(self):
+        w = world()
+        w.charge("motor.angle")
+        w.sync()
+        return int(round(self._state.angle * self._sign + self._offset))
+
+    def reset_angle(self, angle=0):
+        world().sync()
+        self._offset = angle - self._state.angle * self._sign
+
+    def speed(self):
+        w = world()
+        w.charge("motor.speed")
+        w.sync()
+        return int(round(self._state.speed * self._sign))
+
+    def run(self, speed):
+        w = world()
+        w.charge("motor.run")
+        w.sync()
+        self._state.run(speed * self._sign)
+
+    def stop(self):
+        self._halt("coast")
+
+    def brake(self):
+        self._halt("brake")
+
+    def hold(self):
+        self._halt("hold")
+
+    def _halt(self, mode):
+        w = world()
+        w.charge("motor.stop")
+        w.sync()
+        self._state.stop(mode)
+
+    def run_target(self, speed, target_angle, then=Stop.HOLD, wait=True):
+        w = world()
+        w.charge("motor.run")
+        w.sync()
+        raw = (target_angle - self._offset) * self._sign
+        self._state.run_target(speed, raw, then)
+        while wait and not self._state.done():
+            w.advance(1)
+
+    def track_target(self, target_angle):
+        w = world()
+        w.charge("motor.run")
+        w.sync()
+        self._state.track((target_angle - self._offset) * self._sign)
+
+    def run_angle(self, speed, rotation_angle, then=Stop.HOLD, wait=True):
+        world().sync()
+        current = self._state.angle * self._sign + self._offset
+        if speed < 0:
+            speed, rotation_angle = -speed, -rotation_angle
+        self.run_target(speed, current + rotation_angle, then, wait)
+
+    def done(self):
+        w = world()
+        w.charge("motor.done")
+        w.sync()
+        return self._state.done()
+
+    def stalled(self):
+        w = world()
+        w.charge("motor.stalled")
+        w.sync()
+        return self._state.stalled()
+
+
+class ColorSensor:
+    def __init__(self, port):
+        world()
+        self._port = port
+
+    def reflection(self):
+        w = world()
+        w.charge("reflection")
+        return int(w.reflection(self._port))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Установка модулей
+# ═══════════════════════════════════════════════════════════════════════════════
+
+MODULES = {
+    "pybricks.parameters": (Port, Direction, Button, Color, Axis, Stop),
+    "pybricks.tools": (wait, StopWatch),
+    "pybricks.hubs": (PrimeHub,),
+    "pybricks.pupdevices": (Motor, ColorSensor),
+}
+
+
+def install(new_world):
+    """Делает мир текущим и регистрирует модули pybricks.* в sys.modules"""
+    global _world
+    _world = new_world
+
+    package = sys.modules.get("pybricks")
+    if package is None or not getattr(package, "__sim__", False):
+        package = types.ModuleType("pybricks")
+        package.__path__ = []
+        package.__sim__ = True
+        sys.modules["pybricks"] = package
+
+    # umath и ustruct на хабе - это math и struct
+    sys.modules["umath"] = math
+    sys.modules["ustruct"] = struct
+
+    for name, members in MODULES.items():
+        module = types.ModuleType(name)
+        for member in members:
+            setattr(module, member.__name__, member)
+        sys.modules[name] = module
+        setattr(package, name.split(".")[1], module)
+    return new_world
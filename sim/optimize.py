@@ -0,0 +1,427 @@
+"""
+Оптимизатор шагов миссии
+
+Записывает шаги миссии (вызовы примитивов верхнего уровня) прогоном в
+симуляторе, ищет в них упрощения и проверяет каждое повторным прогоном:
+
+    - подряд идущие повороты складываются в один
+    - прямые в одну сторону сливаются в одну (без торможения между ними)
+    - подряд идущие паузы складываются, нулевые убираются
+    - пары без итогового эффекта (поворот туда-обратно, вперёд-назад на
+      то же расстояние, рука туда-обратно) и паузы между шагами
+
+Упрощения, которые убирают движение робота или руки (пары без эффекта,
+повороты с меньшим размахом, паузы), могут менять то, что робот делает
+с моделями на поле, - они только предлагаются с оценкой выигрыша и
+применяются лишь с --apply-flagged.
+
+    python -m sim.optimize 2
+    python -m sim.optimize 5 --apply-flagged
+"""
+
+import argparse
+import inspect
+
+from . import load, run_mission
+
+TURNS = ("gyro_turn", "turn_to")
+FORWARD = ("gyro_straight", "gyro_straight_accel")
+BACKWARD = ("gyro_back", "gyro_back_accel")
+
+# Насколько упрощение может сдвинуть конечную позу, чтобы считаться безопасным
+POSE_TOLERANCE_MM = 30
+POSE_TOLERANCE_DEG = 3
+
+
+class Step:
+    """Вызов примитива: имя и все параметры (с подставленными умолчаниями)"""
+
+    def __init__(self, name, params, duration=0, task=None):
+        self.name = name
+        self.params = params
+        self.duration = duration
+        self.task = task        # для start: имя запускаемого примитива
+
+    def replace(self, **params):
+        merged = dict(self.params)
+        merged.update(params)
+        return Step(self.name, merged, task=self.task)
+
+    def __repr__(self):
+        name = self.name if self.task is None else "start %s" % self.task
+        return "%s(%s)" % (name, ", ".join("%s=%r" % item for item in self.params.items()
+                                           if not isinstance(item[1], tuple)))
+
+
+class Rewrite:
+    """Упрощение окна шагов [start, end)"""
+
+    def __init__(self, start, end, steps, text, flagged=False):
+        self.start = start
+        self.end = end
+        self.steps = steps
+        self.text = text
+        self.flagged = flagged
+        self.saving = None
+        self.pose_shift = None
+
+    def apply(self, steps):
+        return steps[:self.start] + self.steps + steps[self.end:]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Запись шагов
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def signature(program, name):
+    func = getattr(program, name)
+    return inspect.signature(getattr(func, "gen", func))
+
+
+def bind(program, name, args, kwargs):
+    bound = signature(program, name).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return dict(bound.arguments)
+
+
+def record(program, number, start_pose=None):
+    """Прогоняет миссию и возвращает (шаги, отчёт)"""
+    report = run_mission(program, number, start_pose=start_pose)
+    steps = []
+    for item in report.steps:
+        args, kwargs = item["call"]
+        name = item["name"]
+        if name == "wait":
+            # wait() робота - та же пауза, но без проверки остановки
+            step = Step("pause", {"duration_ms": args[0] if args else kwargs["time"]})
+        elif name == "start":
+            task = args[0].name
+            step = Step("start", bind(program, task, args[1:], kwargs), task=task)
+        else:
+            step = Step(name, bind(program, name, args, kwargs))
+        step.duration = item["duration"]
+        steps.append(step)
+    return steps, report
+
+
+def replay(program, steps):
+    """Функция-миссия, которая выполняет записанные шаги"""
+    def mission():
+        for step in steps:
+            if step.task is not None:
+                program.start(getattr(program, step.task), *call_args(program, step.task, step.params))
+            else:
+                getattr(program, step.name)(*call_args(program, step.name, step.params))
+    return mission
+
+
+def call_args(program, name, params):
+    """Параметры -> позиционные аргументы (в том числе *segments)"""
+    args = []
+    for parameter in signature(program, name).parameters.values():
+        if parameter.kind == parameter.VAR_POSITIONAL:
+            args.extend(params[parameter.name])
+        else:
+            args.append(params.get(parameter.name, parameter.default))
+    return args
+
+
+def simulate(program, number, steps, start_pose=None):
+    report = run_mission(program, number, start_pose=start_pose, mission=replay(program, steps))
+    if report.error or report.stopped:
+        return None
+    return report
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Упрощения
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def as_profile(step):
+    """Прямая с постоянной скоростью -> параметры трапеции"""
+    p = step.params
+    if "speed" in p:
+        speed = p["speed"]
+        return {"accel": 0, "decel": 0, "min_speed": speed, "max_speed": speed,
+                "end_speed": speed, "gain": p["gain"]}
+    return {key: p[key] for key in ("accel", "decel", "min_speed", "max_speed", "end_speed", "gain")}
+
+
+def candidates(steps):
+    """Все упрощения пар соседних шагов"""
+    found = []
+    for i in range(len(steps)):
+        a = steps[i]
+        if a.name == "pause" and a.params["duration_ms"] <= 0:
+            found.append(Rewrite(i, i + 1, [], "пауза 0 мс - убрать"))
+            continue
+        if a.name == "pause" and 0 < i < len(steps) - 1:
+            found.append(Rewrite(i, i + 1, [], "пауза %d мс между %s и %s - убрать" % (
+                a.params["duration_ms"], steps[i - 1].name, steps[i + 1].name), flagged=True))
+        if a.name == "join_all" and i == len(steps) - 1:
+            found.append(Rewrite(i, i + 1, [], "join_all в конце - launch и так ждёт задачи"))
+        if i + 1 >= len(steps):
+            break
+        b = steps[i + 1]
+        window = "%s + %s" % (a.name, b.name)
+
+        if a.name == "pause" and b.name == "pause":
+            total = a.params["duration_ms"] + b.params["duration_ms"]
+            found.append(Rewrite(i, i + 2, [a.replace(duration_ms=total)],
+                                 "паузы подряд -> pause(%d)" % total))
+
+        elif a.name in TURNS and b.name in TURNS:
+            if b.name == "turn_to":
+                found.append(Rewrite(i, i + 2, [b], "%s: первый поворот не нужен" % window, flagged=True))
+            elif a.name == "turn_to":
+                heading = a.params["heading"] + b.params["target_angle"]
+                merged = Step("turn_to", {"heading": heading, "accuracy": b.params["accuracy"]})
+                found.append(Rewrite(i, i + 2, [merged], "%s -> turn_to(%g)" % (window, heading),
+                                     flagged=True))
+            else:
+                x, y = a.params["target_angle"], b.params["target_angle"]
+                total = x + y
+                if total == 0:
+                    found.append(Rewrite(i, i + 2, [], "поворот %g и обратно - убрать" % x, flagged=True))
+                else:
+                    # Повороты в разные стороны: робот больше не доходит до промежуточного курса
+                    found.append(Rewrite(i, i + 2, [b.replace(target_angle=total)],
+                                         "повороты %g и %g -> gyro_turn(%g)" % (x, y, total),
+                                         flagged=x * y < 0))
+
+        elif a.name in FORWARD + BACKWARD and b.name in FORWARD + BACKWARD:
+            same = (a.name in FORWARD) == (b.name in FORWARD)
+            if a.params.get("heading") is not None or b.params.get("heading") is not None:
+                continue
+            da, db = a.params["distance_degrees"], b.params["distance_degrees"]
+            if same:
+                first, second = as_profile(a), as_profile(b)
+                name = "gyro_straight_accel" if a.name in FORWARD else "gyro_back_accel"
+                merged = Step(name, {
+                    "distance_degrees": da + db,
+                    "accel": first["accel"],
+                    "decel": second["decel"],
+                    "min_speed": first["min_speed"],
+                    "max_speed": min(first["max_speed"], second["max_speed"]),
+                    "end_speed": second["end_speed"],
+                    "gain": first["gain"],
+                    "heading": None,
+                    "jerk": a.params.get("jerk") or b.params.get("jerk"),
+                })
+                found.append(Rewrite(i, i + 2, [merged], "%s -> одна прямая %d°" % (window, da + db)))
+            elif da == db:
+                found.append(Rewrite(i, i + 2, [], "%s на %d° - убрать" % (window, da), flagged=True))
+
+        elif a.name == "rotate" and b.name == "rotate" and a.params["motor"] is b.params["motor"] \
+                and a.params["target_angle"] == -b.params["target_angle"]:
+            found.append(Rewrite(i, i + 2, [], "рука %g и обратно - убрать" % a.params["target_angle"],
+                                 flagged=True))
+    return found
+
+
+def pose_shift(a, b):
+    dx, dy = a.pose[0] - b.pose[0], a.pose[1] - b.pose[1]
+    return (dx * dx + dy * dy) ** 0.5, abs(a.pose[2] - b.pose[2])
+
+
+class Result:
+    """Итог оптимизации; время - мс симуляции"""
+
+    def __init__(self, steps, before):
+        self.steps = steps
+        self.before = before
+        self.after = before
+        self.applied = []
+        self.flagged = []
+        self.rejected = {}  # текст упрощения -> почему не применено
+
+
+def optimize(program, number, start_pose=None, apply_flagged=False):
+    """Записывает миссию и упрощает её шаги; возвращает Result"""
+    steps, original = record(program, number, start_pose)
+    baseline = simulate(program, number, steps, start_pose)
+    if baseline is None:
+        raise RuntimeError("Записанные шаги миссии %d не выполняются в симуляторе" % number)
+    current = baseline
+    result = Result(steps, baseline.duration)
+    tried = set()
+
+    # Жадно: применяем первое упрощение, которое не замедляет и не сдвигает позу
+    while True:
+        for rewrite in candidates(steps):
+            key = (rewrite.text, rewrite.start)
+            if key in tried or rewrite.flagged and not apply_flagged:
+                continue
+            tried.add(key)
+            new_steps = rewrite.apply(steps)
+            report = simulate(program, number, new_steps, start_pose)
+            if report is None:
+                result.rejected[rewrite.text] = "ошибка в симуляции"
+                continue
+            rewrite.saving = current.duration - report.duration
+            rewrite.pose_shift = pose_shift(report, baseline)
+            if rewrite.saving < 0:
+                result.rejected[rewrite.text] = "медленнее на %d мс" % -rewrite.saving
+                continue
+            if not rewrite.flagged and (rewrite.pose_shift[0] > POSE_TOLERANCE_MM or
+                                        rewrite.pose_shift[1] > POSE_TOLERANCE_DEG):
+                result.rejected[rewrite.text] = "поза сдвигается на %.0f мм / %.1f°" % rewrite.pose_shift
+                continue
+            steps = new_steps
+            current = report
+            result.applied.append(rewrite)
+            break
+        else:
+            break
+
+    if not apply_flagged:
+        for rewrite in candidates(steps):
+            if not rewrite.flagged:
+                continue
+            report = simulate(program, number, rewrite.apply(steps), start_pose)
+            if report is not None:
+                rewrite.saving = current.duration - report.duration
+                rewrite.pose_shift = pose_shift(report, current)
+            result.flagged.append(rewrite)
+
+    result.steps = steps
+    result.after = current.duration
+    return result
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Таблица миссии
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def inverse(table):
+    return {name: op for op, name in table.items()}
+
+
+def table_step(program, op, name, params, positional=()):
+    """Шаг таблицы: опкод, обязательные аргументы, профиль и поправки"""
+    parameters = list(signature(program, name).parameters.values())
+    params = {p.name: params.get(p.name, p.default) for p in parameters}
+    required = [p for p in parameters if p.default is p.empty and p.kind != p.VAR_POSITIONAL]
+    optional = [p for p in parameters if p.default is not p.empty]
+    changed = {p.name: params[p.name] for p in optional if params[p.name] != p.default}
+
+    best = None
+    for profile, values in sorted(getattr(program, "PROFILES", {}).items()):
+        if any(key not in params for key in values):
+            continue
+        overrides = {key: params[key] for key in values if params[key] != values[key]}
+        overrides.update({key: value for key, value in changed.items() if key not in values})
+        if len(overrides) < len(changed) and (best is None or len(overrides) < len(best[1])):
+            best = (profile, overrides)
+
+    result = [op] + [params[p.name] for p in required] + list(positional)
+    if best:
+        result.append(best[0])
+        if best[1]:
+            result.append(best[1])
+    else:
+        # Без профиля - позиционно до последнего изменённого параметра
+        last = max([i for i, p in enumerate(optional) if p.name in changed] or [-1])
+        result += [params[p.name] for p in optional[:last + 1]]
+    return tuple(result)
+
+
+def segment_step(program, segment):
+    """Сегмент follow_path -> кортеж сегмента таблицы"""
+    ops = inverse(program.SEGMENTS)
+    kind = segment[0]
+    if kind in ("turn", "face"):
+        return table_step(program, ops[kind], kind, {"angle" if kind == "turn" else "heading": segment[2],
+                                                     "accuracy": segment[3]})
+    keys = ("accel", "decel", "min_speed", "max_speed", "end_speed", "gain")
+    params = dict(zip(keys, segment[3:]))
+    if segment[2]:
+        params["distance_degrees"] = -segment[1] if kind == "back" else segment[1]
+        params["angle"] = segment[2]
+        return table_step(program, ops["arc"], "arc", params)
+    params["distance_degrees"] = segment[1]
+    return table_step(program, ops[kind], kind, params)
+
+
+def to_table(program, steps):
+    """Шаги -> таблица миссии; шаги без опкода возвращаются строкой-комментарием"""
+    ops = inverse(program.OPS)
+    table = []
+    for step in steps:
+        if step.task is not None:
+            table.append(("start",) + table_step(program, ops[step.task], step.task, step.params))
+        elif step.name == "follow_path":
+            table.append((ops["follow_path"],) + tuple(segment_step(program, s) for s in step.params["segments"]))
+        elif step.name in ops:
+            table.append(table_step(program, ops[step.name], step.name, step.params))
+        else:
+            table.append("# %r - нет опкода" % step)
+    return table
+
+
+def format_value(program, value):
+    if isinstance(value, str):
+        return '"%s"' % value
+    if isinstance(value, dict):
+        return "{%s}" % ", ".join('"%s": %s' % (k, format_value(program, v)) for k, v in value.items())
+    if isinstance(value, (bool, int, float)) or value is None:
+        return repr(value)
+    for name, candidate in vars(program).items():
+        if candidate is value:
+            return name
+    return repr(value)
+
+
+def format_table(program, name, table):
+    lines = ["%s = (" % name]
+    for step in table:
+        if isinstance(step, str):
+            lines.append("    " + step)
+        elif step[0] == "path":
+            lines.append('    ("path",')
+            for segment in step[1:]:
+                lines.append("        (%s)," % ", ".join(format_value(program, v) for v in segment))
+            lines.append("    ),")
+        else:
+            values = [format_value(program, v) for v in step]
+            lines.append("    (%s%s)," % (", ".join(values), "," if len(values) == 1 else ""))
+    lines.append(")")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.optimize", description="Упрощение шагов миссии")
+    parser.add_argument("mission", type=int, help="номер миссии (1..8)")
+    parser.add_argument("--start", default="200,200,0", help="x,y,курс старта (мм, мм, °)")
+    parser.add_argument("--apply-flagged", action="store_true",
+                        help="применять и упрощения, которые убирают движение")
+    args = parser.parse_args(argv)
+
+    program = load()
+    start = tuple(float(v) for v in args.start.split(","))
+    result = optimize(program, args.mission, start, args.apply_flagged)
+
+    print("Миссия %d: %d мс -> %d мс (%+d мс)" % (
+        args.mission, result.before, result.after, result.after - result.before))
+    if result.applied:
+        print("Применено:")
+        for rewrite in result.applied:
+            print("  шаг %d: %s  %+d мс" % (rewrite.start + 1, rewrite.text, -rewrite.saving))
+    if result.rejected:
+        print("Не применено:")
+        for text, reason in result.rejected.items():
+            print("  %s: %s" % (text, reason))
+    if result.flagged:
+        print("На проверку (убирает движение - может влиять на модели на поле):")
+        for rewrite in result.flagged:
+            if rewrite.saving is None:
+                estimate = "ошибка в симуляции"
+            else:
+                estimate = "%+d мс, поза сдвинется на %.0f мм / %.1f°" % ((-rewrite.saving,) + rewrite.pose_shift)
+            print("  шаг %d: %s  %s" % (rewrite.start + 1, rewrite.text, estimate))
+    print()
+    print(format_table(program, "mission_%d" % args.mission, to_table(program, result.steps)))
+
+
+if __name__ == "__main__":
+    main()
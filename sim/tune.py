@@ -0,0 +1,328 @@
+"""
+Подбор параметров прямых по симуляции
+
+Для каждой прямой миссии (gyro_straight_accel, gyro_back_accel и прямых
+сегментов follow_path) ищет accel, decel, min_speed, max_speed, end_speed
+и gain, при которых миссия быстрее, а поза робота после шага (и следующего
+за ним) остаётся в пределах допуска от позы с исходными параметрами.
+Шаги настраиваются по очереди; кандидаты считаются параллельно в пуле
+процессов, каждый - прогоном начала миссии в симуляторе.
+
+    python -m sim.tune 1                             # покоординатный спуск
+    python -m sim.tune 1 --method grid --params accel,decel,max_speed
+    python -m sim.tune 5 --method random --samples 300 --out tuned.py
+    python -m sim.tune 2 --grip 1500                 # скользкое поле
+
+Подбор идёт с конечным сцеплением колёс (--grip, мм/с²): без него модель
+разгоняет робота мгновенно и поиск всегда выбирает accel 0. Разгон
+трапеции, требующий ускорения больше сцепления, отбрасывается сразу.
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import random
+
+from . import devices, load
+from .optimize import format_table, record, simulate, to_table
+
+# Сцепление колёс при подборе, мм/с²: чуть меньше разгона мотора
+# (run_accel 4000 град/с² ≈ 1950 мм/с²) - ступенька скорости буксует.
+# World по умолчанию - без предела.
+GRIP = 1800
+
+PARAMS = ("accel", "decel", "min_speed", "max_speed", "end_speed", "gain")
+
+# Диапазон и шаг каждого параметра (random и спуск)
+SPACE = {
+    "accel": (0, 300, 10),
+    "decel": (0, 400, 10),
+    "min_speed": (50, 300, 10),
+    "max_speed": (300, 1000, 50),
+    "end_speed": (0, 300, 10),
+    "gain": (1.0, 10.0, 0.5),
+}
+
+# Значения для перебора сеткой
+GRID = {
+    "accel": (0, 20, 50, 100, 200, 300),
+    "decel": (10, 50, 100, 200, 300),
+    "min_speed": (80, 100, 150, 200),
+    "max_speed": (600, 800, 1000),
+    "end_speed": (60, 80, 150),
+    "gain": (3.0, 5.0, 8.0),
+}
+
+# Поля сегмента пути (см. straight() в v1.py)
+SEGMENT_FIELDS = ("kind", "distance", "angle") + PARAMS
+
+TUNED = ("gyro_straight_accel", "gyro_back_accel")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Шаги и их параметры
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def targets(steps):
+    """Настраиваемые прямые: [(номер шага, номер сегмента или None)]"""
+    found = []
+    for k, step in enumerate(steps):
+        if step.name in TUNED and step.task is None:
+            found.append((k, None))
+        elif step.name == "follow_path":
+            for i, segment in enumerate(step.params["segments"]):
+                if segment[0] in ("straight", "back") and not segment[2]:
+                    found.append((k, i))
+    return found
+
+
+def values_of(steps, target):
+    k, i = target
+    if i is None:
+        return {key: steps[k].params[key] for key in PARAMS}
+    segment = steps[k].params["segments"][i]
+    return {key: segment[SEGMENT_FIELDS.index(key)] for key in PARAMS}
+
+
+def describe(steps, target):
+    k, i = target
+    if i is None:
+        return "шаг %d %s(%d)" % (k + 1, steps[k].name, steps[k].params["distance_degrees"])
+    segment = steps[k].params["segments"][i]
+    return "шаг %d follow_path, сегмент %d %s(%d)" % (k + 1, i + 1, segment[0], segment[1])
+
+
+def apply(steps, overrides):
+    """Шаги с подставленными параметрами {(шаг, сегмент): {параметр: значение}}"""
+    steps = list(steps)
+    for (k, i), values in sorted(overrides.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        step = steps[k]
+        if i is None:
+            steps[k] = step.replace(**values)
+            continue
+        segments = list(step.params["segments"])
+        segment = list(segments[i])
+        for key, value in values.items():
+            segment[SEGMENT_FIELDS.index(key)] = value
+        segments[i] = tuple(segment)
+        steps[k] = step.replace(segments=tuple(segments))
+    return steps
+
+
+def valid(values, max_accel=None):
+    """
+    Допустимый кандидат; max_accel - предел ускорения разгона по сцеплению,
+    град/с² колеса (None - без предела)
+    """
+    if values["min_speed"] > values["max_speed"] or values["end_speed"] > values["max_speed"]:
+        return False
+    if max_accel:
+        # Ускорение разгона трапеции: (max² - min²) / 2·accel
+        rise = values["max_speed"] ** 2 - values["min_speed"] ** 2
+        if rise > 2 * values["accel"] * max_accel:
+            return False
+    return True
+
+
+def grip_accel(program, grip):
+    """Сцепление мм/с² -> предел ускорения колеса, град/с² (None - без предела)"""
+    return grip / program.MM_PER_DEGREE if grip else None
+
+
+def set_grip(grip):
+    """Сцепление колёс мира симулятора; 0 - колёса не буксуют"""
+    devices.world().config.grip_accel = grip or None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Оценка в процессах пула
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_worker = {}
+
+
+def _init(number, start_pose, grip):
+    program = load()
+    set_grip(grip)
+    steps, _ = record(program, number, start_pose)
+    _worker.update(program=program, steps=steps, number=number, start_pose=start_pose)
+
+
+def _evaluate(job):
+    """(подстановки, сколько шагов прогнать) -> (мс, поза) или None при ошибке"""
+    overrides, count = job
+    steps = apply(_worker["steps"], overrides)[:count]
+    report = simulate(_worker["program"], _worker["number"], steps, _worker["start_pose"])
+    if report is None:
+        return None
+    return report.duration, report.pose
+
+
+def pose_shift(a, b):
+    dx, dy = a[0] - b[0], a[1] - b[1]
+    return (dx * dx + dy * dy) ** 0.5, abs(a[2] - b[2])
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         Поиск
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def snap(key, value):
+    low, high, step = SPACE[key]
+    value = min(high, max(low, round(value / step) * step))
+    return float(value) if isinstance(step, float) else int(value)
+
+
+def grid_candidates(start, params, rng, samples):
+    for combo in itertools.product(*[GRID[key] for key in params]):
+        values = dict(start)
+        values.update(zip(params, combo))
+        yield values
+
+
+def random_candidates(start, params, rng, samples):
+    for _ in range(samples):
+        values = dict(start)
+        for key in params:
+            low, high, step = SPACE[key]
+            values[key] = snap(key, rng.uniform(low, high))
+        yield values
+
+
+def neighbours(start, params, deltas):
+    for key in params:
+        for sign in (-1, 1):
+            values = dict(start)
+            values[key] = snap(key, start[key] + sign * deltas[key])
+            if values[key] != start[key]:
+                yield values
+
+
+class Tuner:
+    """
+    Args:
+        pool: multiprocessing.Pool с _init
+        steps: Записанные шаги миссии
+        pose_mm, pose_deg: Допуск позы после шага
+        max_accel: Предел ускорения разгона, град/с² колеса (grip_accel)
+    """
+
+    def __init__(self, pool, steps, pose_mm=10, pose_deg=2, max_accel=None):
+        self.pool = pool
+        self.steps = steps
+        self.max_accel = max_accel
+        self.pose_mm = pose_mm
+        self.pose_deg = pose_deg
+        self.overrides = {}
+        self.evaluations = 0
+
+    def score(self, target, candidates, bounded=True):
+        """Лучший допустимый кандидат: (мс, значения) или None"""
+        k = target[0]
+        count = min(k + 2, len(self.steps))  # шаг и следующий: он наследует скорость и позу
+        reference = self.pool.map(_evaluate, [({}, count)])[0]
+        jobs = []
+        for values in candidates:
+            if valid(values, self.max_accel if bounded else None):
+                overrides = dict(self.overrides)
+                overrides[target] = values
+                jobs.append((values, (overrides, count)))
+        self.evaluations += len(jobs)
+        results = self.pool.map(_evaluate, [job for _, job in jobs])
+
+        best = None
+        for (values, _), result in zip(jobs, results):
+            if result is None:
+                continue
+            mm, deg = pose_shift(result[1], reference[1])
+            if mm > self.pose_mm or deg > self.pose_deg:
+                continue
+            if best is None or result[0] < best[0]:
+                best = (result[0], values)
+        return best
+
+    def search(self, target, method, params, samples=200, seed=0):
+        """Подбирает параметры одной прямой; возвращает (было мс, стало мс, значения)"""
+        start = values_of(self.steps, target)
+        # Исходные параметры - точка отсчёта, даже если разгон резче сцепления
+        current = self.score(target, [start], bounded=False)
+        if current is None:
+            return None
+        before = current[0]
+        rng = random.Random(seed)
+
+        if method == "descent":
+            deltas = {key: (SPACE[key][1] - SPACE[key][0]) / 4 for key in params}
+            while any(deltas[key] >= SPACE[key][2] for key in params):
+                found = self.score(target, neighbours(current[1], params, deltas))
+                if found and found[0] < current[0]:
+                    current = found
+                else:
+                    deltas = {key: delta / 2 for key, delta in deltas.items()}
+        else:
+            generate = grid_candidates if method == "grid" else random_candidates
+            found = self.score(target, generate(start, params, rng, samples))
+            if found and found[0] < current[0]:
+                current = found
+
+        if current[0] < before:
+            self.overrides[target] = current[1]
+        return before, current[0], current[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sim.tune", description="Подбор параметров прямых миссии")
+    parser.add_argument("mission", type=int, help="номер миссии (1..8)")
+    parser.add_argument("--method", choices=("descent", "grid", "random"), default="descent")
+    parser.add_argument("--params", default=",".join(PARAMS), help="какие параметры подбирать")
+    parser.add_argument("--samples", type=int, default=200, help="кандидатов на прямую (random)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pose-mm", type=float, default=10, help="допуск позы после шага, мм")
+    parser.add_argument("--pose-deg", type=float, default=2, help="допуск курса после шага, °")
+    parser.add_argument("--start", default="200,200,0", help="x,y,курс старта (мм, мм, °)")
+    parser.add_argument("--grip", type=float, default=GRIP,
+                        help="сцепление колёс, мм/с² (0 - без предела, как World по умолчанию)")
+    parser.add_argument("--jobs", type=int, default=None, help="процессов (по умолчанию - все ядра)")
+    parser.add_argument("--out", help="записать таблицу миссии в файл")
+    args = parser.parse_args(argv)
+
+    params = args.params.split(",")
+    for key in params:
+        if key not in PARAMS:
+            parser.error("нет параметра %r" % key)
+    start = tuple(float(v) for v in args.start.split(","))
+
+    program = load()
+    set_grip(args.grip)
+    steps, _ = record(program, args.mission, start)
+    with multiprocessing.Pool(args.jobs, initializer=_init, initargs=(args.mission, start, args.grip)) as pool:
+        tuner = Tuner(pool, steps, args.pose_mm, args.pose_deg, grip_accel(program, args.grip))
+        for target in targets(steps):
+            result = tuner.search(target, args.method, params, args.samples, args.seed)
+            if result is None:
+                print("%s: не выполняется в симуляторе или поза уже вне допуска" % describe(steps, target))
+                continue
+            before, after, values = result
+            old = values_of(steps, target)
+            changes = ", ".join("%s %g->%g" % (key, old[key], values[key])
+                                for key in PARAMS if values[key] != old[key])
+            print("%s: %d -> %d мс  %s" % (describe(steps, target), before, after, changes or "без изменений"))
+
+        full_before, full_after = pool.map(_evaluate, [({}, len(steps)), (tuner.overrides, len(steps))])
+
+    mm, deg = pose_shift(full_after[1], full_before[1])
+    print("Миссия %d: %d -> %d мс (%+d мс), поза в конце сдвинулась на %.0f мм / %.1f°; %d прогонов" % (
+        args.mission, full_before[0], full_after[0], full_after[0] - full_before[0], mm, deg, tuner.evaluations))
+
+    text = format_table(program, "mission_%d" % args.mission, to_table(program, apply(steps, tuner.overrides)))
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print("Таблица записана в", args.out)
+    else:
+        print()
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Модель мира симулятора: виртуальные часы, моторы, кинематика робота, поле
+"""
+
+import math
+
+STORAGE_SIZE = 512  # байт hub.system.storage на SPIKE Prime
+
+
+class RobotConfig:
+    """Параметры нашего робота (меняются под реальные замеры)"""
+
+    wheel_diameter = 56.0       # мм
+    axle_track = 112.0          # мм между колёсами
+    max_speed = 1050.0          # град/с - предел мотора
+    run_accel = 4000.0          # град/с² - разгон/торможение при run()
+    brake_decel = 12000.0       # град/с² - brake()
+    coast_decel = 2500.0        # град/с² - stop()
+    hold_decel = 30000.0        # град/с² - hold()
+    hold_speed = 200.0          # град/с - возврат к удерживаемому углу
+    stall_time = 0.2            # с упора до stalled(), как в Pybricks
+    gyro_scale = 354 / 360      # хаб показывает 354° за полный оборот
+    gyro_drift = 0.0            # °/с - уход показаний гироскопа в покое
+    battery_voltage = 8000      # мВ в начале миссии
+    battery_drain = 0.0         # мВ/с - разряд за миссию
+    nominal_voltage = 8000      # мВ, при которых мотор даёт max_speed и run_accel
+    grip_accel = None           # мм/с² - сцепление колёс с полем; None - не буксуют
+    accel_filter = 0.01         # с - акселерометр сглаживает ускорение за это время
+
+    # Колёсные порты: (сторона, знак "вперёд" для сырого угла вала)
+    wheels = {"A": ("left", 1), "E": ("right", -1)}
+
+    # Датчики цвета: порт -> (вперёд от центра, влево от центра), мм
+    sensors = {"D": (70.0, 24.0), "C": (70.0, -24.0)}
+
+
+class Field:
+    """
+    Поле как растр отражения (0-100)
+
+    Args:
+        width, height: Размер поля в мм
+        resolution: мм на пиксель
+        background: Отражение пустого поля
+    """
+
+    def __init__(self, width=2362, height=1143, resolution=5, background=60):
+        self.width = width
+        self.height = height
+        self.resolution = resolution
+        self.cols = int(width // resolution) + 1
+        self.rows = int(height // resolution) + 1
+        self.pixels = bytearray([background]) * (self.cols * self.rows)
+
+    @classmethod
+    def from_pgm(cls, path, width=2362, height=1143):
+        """Загружает растр из PGM (P2/P5), 0 = чёрное, maxval = белое"""
+        with open(path, "rb") as f:
+            data = f.read()
+        tokens = []
+        pos = 0
+        # Заголовок: магия, ширина, высота, maxval (с комментариями #)
+        while len(tokens) < 4:
+            while data[pos:pos + 1].isspace():
+                pos += 1
+            if data[pos:pos + 1] == b"#":
+                while data[pos:pos + 1] not in (b"\n", b""):
+                    pos += 1
+                continue
+            start = pos
+            while not data[pos:pos + 1].isspace():
+                pos += 1
+            tokens.append(data[start:pos])
+        magic, cols, rows, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+        if magic == b"P5":
+            raw = data[pos + 1:pos + 1 + cols * rows]
+        elif magic == b"P2":
+            raw = [int(v) for v in data[pos:].split()[:cols * rows]]
+        else:
+            raise ValueError("Нужен PGM (P2 или P5), получено %r" % magic)
+
+        field = cls(width, height, resolution=width / cols)
+        field.cols = cols
+        field.rows = rows
+        field.pixels = bytearray(v * 100 // maxval for v in raw)
+        return field
+
+    def draw_line(self, x1, y1, x2, y2, thickness=20, value=10):
+        """Рисует линию (мм) заданной толщины"""
+        length = math.hypot(x2 - x1, y2 - y1)
+        steps = max(1, int(length / (self.resolution / 2)))
+        half = thickness / 2
+        for i in range(steps + 1):
+            x = x1 + (x2 - x1) * i / steps
+            y = y1 + (y2 - y1) * i / steps
+            self.fill_rect(x - half, y - half, x + half, y + half, value)
+
+    def fill_rect(self, x1, y1, x2, y2, value):
+        r = self.resolution
+        for row in range(max(0, int(y1 / r)), min(self.rows, int(y2 / r) + 1)):
+            for col in range(max(0, int(x1 / r)), min(self.cols, int(x2 / r) + 1)):
+                self.pixels[row * self.cols + col] = value
+
+    def reflection(self, x, y):
+        """Отражение в точке (мм); за краем поля - стол, чёрный"""
+        col = int(x / self.resolution)
+        row = int(y / self.resolution)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return self.pixels[row * self.cols + col]
+        return 5
+
+
+class MotorState:
+    """
+    Состояние одного мотора в сырых координатах вала
+
+    Режимы: coast, brake, hold, run (скорость), target (run_target/run_angle),
+    track (track_target - к углу полным моментом, без профиля)
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.angle = 0.0
+        self.speed = 0.0
+        self.mode = "coast"
+        self.command = 0.0
+        self.target = 0.0
+        self.then = "hold"
+        self.stop_at = None     # упор: сырой угол, дальше которого вал не повернуть
+        self.pushing = 0.0      # с - сколько мотор давит в упор
+        self.power = 1.0        # доля max_speed и run_accel от напряжения батареи
+
+    def reset(self):
+        self.angle = 0.0
+        self.speed = 0.0
+        self.mode = "coast"
+        self.command = 0.0
+        self.stop_at = None
+        self.pushing = 0.0
+
+    def run(self, speed):
+        limit = self.config.max_speed
+        self.command = max(-limit, min(limit, speed))
+        self.mode = "run"
+        self.pushing = 0.0
+
+    def run_target(self, speed, target, then="hold"):
+        self.command = min(abs(speed), self.config.max_speed)
+        self.target = target
+        self.then = then
+        self.mode = "target"
+        self.pushing = 0.0
+
+    def track(self, target):
+        self.target = target
+        self.mode = "track"
+        self.pushing = 0.0
+
+    def stop(self, mode):
+        self.mode = mode
+        self.pushing = 0.0
+        self.command = 0.0
+        # hold() удерживает угол, на котором его вызвали
+        self.target = self.angle
+
+    def done(self):
+        return self.mode != "target"
+
+    def stalled(self):
+        return self.pushing >= self.config.stall_time
+
+    def step(self, dt):
+        """Продвигает мотор на dt секунд"""
+        if self.speed == 0.0 and self.mode in ("coast", "brake") and self.stop_at is None:
+            return  # стоит - большая часть моторов почти всю миссию
+        config = self.config
+        top = config.max_speed * self.power
+        if self.mode == "run":
+            desired, accel = max(-top, min(top, self.command)), config.run_accel * self.power
+        elif self.mode in ("target", "hold", "track"):
+            if self.mode == "target":
+                accel, limit = config.run_accel * self.power, min(top, self.command)
+            elif self.mode == "track":
+                accel, limit = config.hold_decel, top
+            else:
+                accel, limit = config.hold_decel, config.hold_speed
+            remaining = self.target - self.angle
+            if abs(remaining) <= max(0.5, abs(self.speed) * dt) and abs(self.speed) < 2 * accel * dt + 50:
+                self.angle = self.target
+                self.speed = 0.0
+                if self.mode == "target":
+                    self.mode = self.then
+                elif self.mode == "track":
+                    self.mode = "hold"
+                return
+            # Трапеция: не быстрее, чем успеем затормозить до цели
+            reachable = math.sqrt(2 * accel * abs(remaining))
+            desired = math.copysign(min(limit, reachable), remaining)
+        elif self.mode == "brake":
+            desired, accel = 0.0, config.brake_decel
+        else:
+            desired, accel = 0.0, config.coast_decel
+
+        old = self.speed
+        change = desired - old
+        max_change = accel * dt
+        if abs(change) > max_change:
+            change = math.copysign(max_change, change)
+        self.speed = old + change
+        self.angle += (old + self.speed) / 2 * dt
+        self._obstacle(dt)
+
+    def _obstacle(self, dt):
+        """Упор (блокированная рука): вал стоит, мотор "давит" - stalled()"""
+        stop_at = self.stop_at
+        if stop_at is None or (self.angle - stop_at) * (1 if stop_at >= 0 else -1) <= 0:
+            self.pushing = 0.0
+            return
+        self.angle = stop_at
+        self.speed = 0.0
+        if self.mode in ("run", "target", "hold", "track"):
+            self.pushing += dt
+
+
+class World:
+    """
+    Весь симулируемый мир
+
+    Время хранится в микросекундах. Физика догоняет часы лениво (sync)
+    шагами постоянной длины step_us: вызов устройства лишь добавляет свою
+    стоимость к часам, а шаг физики делается, когда их накопилось на целый
+    шаг (датчики видят состояние не старше step_us).
+    """
+
+    # Оценка стоимости вызовов API на хабе, мкс (учитывается в часах)
+    CALL_COST_US = {
+        "battery.voltage": 40,
+        "buttons.pressed": 120,
+        "imu.heading": 40,
+        "imu.angular_velocity": 40,
+        "imu.acceleration": 40,
+        "motor.angle": 30,
+        "motor.speed": 30,
+        "motor.stalled": 20,
+        "motor.run": 60,
+        "motor.stop": 40,
+        "motor.done": 20,
+        "reflection": 90,
+        "stopwatch.time": 10,
+    }
+
+    def __init__(self, config=None, field=None, step_us=1000, call_costs=True):
+        self.config = config or RobotConfig()
+        self.field = field or Field()
+        self.step_us = step_us
+        self.call_costs = call_costs
+        self.motors = {}
+        self.start_pose = (200.0, 200.0, 0.0)
+        # Память хаба (hub.system.storage) - не сбрасывается между миссиями
+        self.storage = bytearray(STORAGE_SIZE)
+        self.reset()
+
+    def reset(self, start_pose=None):
+        """Возвращает мир к началу миссии; start_pose = (x мм, y мм, курс °)"""
+        if start_pose is not None:
+            self.start_pose = start_pose
+        self.now_us = 0
+        self.phys_us = 0
+        self.x, self.y, theta = self.start_pose
+        self.theta = math.radians(theta)
+        self.heading_ref = 0.0
+        self.heading_offset = 0.0
+        self.heading_us = 0
+        self.rate = 0.0
+        self.speed = 0.0        # мм/с - скорость корпуса (при пробуксовке меньше колёс)
+        self.accel = 0.0        # мм/с² - ускорение корпуса (акселерометр)
+        self.calls = {}
+        self.presses = []
+        for motor in self.motors.values():
+            motor.reset()
+
+    def motor(self, port):
+        if port not in self.motors:
+            self.motors[port] = MotorState(self.config)
+        return self.motors[port]
+
+    def block(self, port, angle):
+        """Упор для мотора port через angle° сырого угла от старта миссии (после reset)"""
+        self.motor(port).stop_at = float(angle)
+
+    # ─── Время ───────────────────────────────────────────────────────────────
+
+    def charge(self, name):
+        """Учитывает вызов API: счётчик и (опционально) стоимость во времени"""
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.call_costs:
+            self.now_us += self.CALL_COST_US.get(name, 0)
+
+    def advance(self, ms):
+        self.now_us += int(ms * 1000)
+        self.sync()
+
+    def time_ms(self):
+        return self.now_us // 1000
+
+    # ─── Батарея ─────────────────────────────────────────────────────────────
+
+    def battery_voltage(self):
+        """Напряжение: заряд в начале миссии минус разряд за её время"""
+        return self.config.battery_voltage - self.config.battery_drain * self.phys_us / 1e6
+
+    def settle(self, timeout_ms=2000):
+        """Ждёт, пока моторы остановятся (робот докатится после brake)"""
+        end = self.now_us + timeout_ms * 1000
+        self.sync()
+        while self.now_us < end and any(abs(m.speed) > 1 for m in self.motors.values()):
+            self.advance(5)
+
+    def sync(self):
+        """Догоняет физику до текущего времени"""
+        step = self.step_us
+        while self.now_us - self.phys_us >= step:
+            self._step(step / 1e6)
+            self.phys_us += step
+
+    def _step(self, dt):
+        power = self.battery_voltage() / self.config.nominal_voltage
+        for motor in self.motors.values():
+            motor.power = power
+            motor.step(dt)
+
+        config = self.config
+        mm_per_deg = math.pi * config.wheel_diameter / 360
+        left = right = 0.0
+        for port, (side, sign) in config.wheels.items():
+            motor = self.motors.get(port)
+            if motor is None:
+                continue
+            if side == "left":
+                left = motor.speed * sign * mm_per_deg
+            else:
+                right = motor.speed * sign * mm_per_deg
+
+        # Пробуксовка: корпус разгоняется не быстрее, чем держит сцепление
+        v = (left + right) / 2
+        if config.grip_accel is not None:
+            limit = config.grip_accel * dt
+            v = self.speed + max(-limit, min(limit, v - self.speed))
+        self.accel += ((v - self.speed) / dt - self.accel) * min(1.0, dt / config.accel_filter)
+        self.speed = v
+        omega = (right - left) / config.axle_track
+        mid = self.theta + omega * dt / 2
+        self.x += v * math.cos(mid) * dt
+        self.y += v * math.sin(mid) * dt
+        self.theta += omega * dt
+        self.rate = math.degrees(omega)
+
+    # ─── Датчики ─────────────────────────────────────────────────────────────
+
+    def heading(self):
+        """Показание гироскопа с учётом его масштаба"""
+        self.sync()
+        true = math.degrees(self.theta) - self.heading_ref
+        drift = self.config.gyro_drift * (self.now_us - self.heading_us) / 1e6
+        return self.heading_offset + true * self.config.gyro_scale + drift
+
+    def reset_heading(self, angle):
+        self.sync()
+        self.heading_ref = math.degrees(self.theta)
+        self.heading_offset = angle
+        self.heading_us = self.now_us
+
+    def angular_velocity_z(self):
+        """Как в Pybricks: против часовой положительно, heading растёт наоборот"""
+        self.sync()
+        return -self.rate * self.config.gyro_scale - self.config.gyro_drift
+
+    def acceleration_x(self):
+        """Ускорение корпуса по ходу, мм/с² (ось X хаба вперёд)"""
+        self.sync()
+        return self.accel
+
+    def reflection(self, port):
+        self.sync()
+        forward, left = self.config.sensors.get(port, (0.0, 0.0))
+        c, s = math.cos(self.theta), math.sin(self.theta)
+        x = self.x + forward * c - left * s
+        y = self.y + forward * s + left * c
+        return self.field.reflection(x, y)
+
+    def press(self, buttons, at_ms, duration_ms=100):
+        """Планирует нажатие кнопок (например, CENTER для остановки)"""
+        self.presses.append((at_ms * 1000, (at_ms + duration_ms) * 1000, frozenset(buttons)))
+
+    def pressed(self):
+        now = self.now_us
+        result = set()
+        for start, end, buttons in self.presses:
+            if start <= now < end:
+                result |= buttons
+        return result
+
+    def pose(self):
+        """Поза (x мм, y мм, курс °) - курс истинный, против часовой"""
+        self.sync()
+        return self.x, self.y, math.degrees(self.theta)
@@ -4,18 +4,26 @@ FLL ROBOT - с остановкой миссии по CENTER
 
 from pybricks.hubs import PrimeHub
 from pybricks.pupdevices import Motor
-from pybricks.parameters import Port, Direction, Button, Color
-from pybricks.tools import wait
+from pybricks.parameters import Port, Direction, Button, Color, Axis
+from pybricks.tools import wait, StopWatch
 from pybricks.pupdevices import ColorSensor
+from array import array
+from umath import pi, sqrt, copysign, atan2, sin, cos
+from ustruct import pack, unpack, calcsize
 
 hub = PrimeHub()
 
 # Отключаем стандартную остановку - будем сами обрабатывать
 hub.system.set_stop_button(None)
 
-# Коррекция гироскопа (полный оборот = 354° вместо 360°)
+# Коррекция гироскопа (полный оборот = 354° вместо 360°) - до первой
+# калибровки calibrate_gyro(), дальше масштаб берётся из памяти хаба
 GYRO_SCALE = 360 / 354  # ≈ 1.017
 
+# Геометрия робота, мм
+WHEEL_DIAMETER = 56
+AXLE_TRACK = 112
+
 print("Загрузка...")
 
 left_motor = Motor(Port.A)
@@ -26,6 +34,39 @@ motor_f = Motor(Port.F)
 print("OK!")
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ПАМЯТЬ ХАБА
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Калибровки хранятся в hub.system.storage и переживают перезапуск программы.
+# Блок: байт STORAGE_MAGIC, байт STORAGE_VERSION, данные struct. Блок другой
+# версии (или ещё не записанный) не читается - остаются значения из
+# программы. Поменяли формат блока - увеличьте STORAGE_VERSION.
+#
+#   смещение  блок          формат
+#   0         торможение    BRAKE_FORMAT
+#   16        отражение     REFLECTION_FORMAT
+#   32        гироскоп      GYRO_FORMAT
+STORAGE_MAGIC = 0xB1
+STORAGE_VERSION = 1
+STORAGE_BRAKE = 0
+STORAGE_REFLECTION = 16
+STORAGE_GYRO = 32
+
+
+def load_settings(offset, fmt):
+    """Данные блока настроек (кортеж) или None, если блока нет"""
+    data = hub.system.storage(offset, read=calcsize(fmt) + 2)
+    if data[0] != STORAGE_MAGIC or data[1] != STORAGE_VERSION:
+        return None
+    return unpack(fmt, data[2:])
+
+
+def save_settings(offset, fmt, *values):
+    """Записывает блок настроек"""
+    hub.system.storage(offset, write=bytes((STORAGE_MAGIC, STORAGE_VERSION)) + pack(fmt, *values))
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 #                         ПРОВЕРКА ОСТАНОВКИ
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -35,152 +76,1480 @@ class StopMission(Exception):
     pass
 
 
-def check_stop():
-    """Проверяет нажата ли CENTER - если да, останавливает миссию"""
-    if Button.CENTER in hub.buttons.pressed():
-        # Останавливаем моторы
-        left_motor.brake()
-        right_motor.brake()
-        motor_b.brake()
-        # Ждём отпускания кнопки
-        while hub.buttons.pressed():
-            wait(20)
-        # Выбрасываем исключение чтобы выйти из миссии
-        raise StopMission()
+# Как часто опрашивать кнопки, мс. check_stop вызывается каждый такт, но
+# hub.buttons.pressed() (и новый set) - только раз в этот интервал.
+# Остановка срабатывает не позже чем через STOP_CHECK_INTERVAL + LOOP_PERIOD.
+STOP_CHECK_INTERVAL = 20
+
+_stop_countdown = 0
+_stop_armed = False
+
+
+def stop_all_motors():
+    brake_wheels()
+    motor_b.brake()
+    motor_f.brake()
+
+
+def arm_stop():
+    """Начало миссии: остановка сработает только на новое нажатие CENTER"""
+    global _stop_countdown, _stop_armed
+    _stop_countdown = 0
+    _stop_armed = False
+
+
+def check_stop(force=False):
+    """
+    Проверяет нажата ли CENTER - если да, останавливает миссию
+
+    force - опросить кнопку сразу, не дожидаясь интервала (между шагами)
+    """
+    global _stop_countdown, _stop_armed
+    if _stop_countdown > 0 and not force:
+        _stop_countdown -= 1
+        return
+    _stop_countdown = STOP_CHECK_INTERVAL // LOOP_PERIOD - 1
+    
+    if Button.CENTER not in hub.buttons.pressed():
+        _stop_armed = True
+        return
+    if not _stop_armed:
+        return  # CENTER ещё держат после запуска миссии
+    
+    # Останавливаем моторы
+    stop_all_motors()
+    # Ждём отпускания кнопки
+    while hub.buttons.pressed():
+        wait(20)
+    # Выбрасываем исключение чтобы выйти из миссии
+    raise StopMission()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ТАКТ УПРАВЛЕНИЯ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Период всех циклов управления, мс
+LOOP_PERIOD = 5
+
+
+class Ticker:
+    """
+    Ровный такт цикла управления на StopWatch
+
+    Ждёт не фиксированное время, а до следующего момента по расписанию,
+    поэтому время работы тела цикла (check_stop, гироскоп) не растягивает
+    период. Считает опоздания (overruns) и разброс момента такта (jitter, мс).
+
+    Пример:
+        ticker = Ticker()
+        while abs(left_motor.angle()) < 500:
+            ...
+            ticker.tick()
+        print(ticker.report())
+    """
+
+    # Последний созданный такт - для статистики после движения
+    last = None
+
+    def __init__(self, period=None):
+        self.period = period or LOOP_PERIOD
+        self.watch = StopWatch()
+        self.deadline = self.period
+        self.now = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.jitter_min = 0
+        self.jitter_max = 0
+        self.jitter_sum = 0
+        Ticker.last = self
+
+    def tick(self):
+        """Ждёт начала следующего периода"""
+        now = self.watch.time()
+        if now < self.deadline:
+            wait(self.deadline - now)
+            now = self.watch.time()
+        else:
+            self.overruns += 1
+
+        jitter = now - self.deadline
+        if self.ticks == 0 or jitter < self.jitter_min:
+            self.jitter_min = jitter
+        if self.ticks == 0 or jitter > self.jitter_max:
+            self.jitter_max = jitter
+        self.jitter_sum += jitter
+        self.ticks += 1
+        self.now = now
+
+        self.deadline += self.period
+        # Отстали больше чем на период - не догоняем пачкой тактов
+        if self.deadline <= now:
+            self.deadline = now + self.period
+
+    def jitter_avg(self):
+        return self.jitter_sum / self.ticks if self.ticks else 0
+
+    def report(self):
+        return "такт %d мс: %d тактов, опозданий %d, jitter %d/%.1f/%d мс" % (
+            self.period, self.ticks, self.overruns,
+            self.jitter_min, self.jitter_avg(), self.jitter_max)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ТЕЛЕМЕТРИЯ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Запись тактов в кольцевой буфер. Курс, команды и отражения берутся из
+# последних значений, которые уже прочитали циклы управления, энкодеры - у
+# update_pose того же такта (без ODOMETRY запись читает их сама, ещё 2
+# вызова API). python -m sim.bench telemetry даёт ~5 мкс на такт - это
+# только оценка вызовов API симулятора (StopWatch раз в TELEMETRY_EVERY
+# тактов, World.CALL_COST_US). Время MicroPython на саму запись (~12
+# записей в array, int() и умножение float) в неё не входит и на хабе не
+# мерилось.
+TELEMETRY = True
+TELEMETRY_SIZE = 1500   # записей в буфере (~26 байт каждая)
+TELEMETRY_EVERY = 2     # писать каждый N-й такт: 1500 × 2 × 5 мс = 15 с истории
+TELEMETRY_DUMP = False  # печатать буфер после каждой миссии (для тренировок)
+TRACE = False           # печатать каждую запись сразу (медленно: только для отладки)
+
+# Фаза движения для телеметрии: 0 - нет, 1 - разгон, 2 - крейсер,
+# 3 - торможение, 4 - поворот на месте
+motion_phase = 0
+
+
+class Telemetry:
+    """
+    Кольцевой буфер тактов в заранее выделенных array: запись такта
+    только заполняет готовые ячейки, буфер не растёт
+
+    Поля такта: время (мс от старта миссии), углы колёс, курс (×10),
+    команды скоростей колёс, отражения левого и правого датчиков,
+    фаза движения, курс-цель (×10), боковая ошибка езды по линии. Начало и конец шагов миссии
+    пишутся отдельно (mark) - по ним sim/analyze.py режет прогон на шаги.
+
+    Формат строк (dump и TRACE):
+        T,t,left,right,heading10,cmd_left,cmd_right,refl_left,refl_right,phase,target10,line
+        S,t,left,right,heading10,имя,аргументы           - начало шага
+        E,t,left,right,heading10,имя,тактов опозданий jitter_min jitter_avg jitter_max
+        X,t,left,right,heading10,имя,подробности         - событие внутри шага (застревание)
+    """
+
+    FIELDS = "t,left,right,heading10,cmd_left,cmd_right,refl_left,refl_right,phase,target10,line"
+
+    def __init__(self, size=TELEMETRY_SIZE, every=TELEMETRY_EVERY):
+        self.size = size
+        self.every = every
+        self.time = array("i", [0] * size)
+        self.left = array("i", [0] * size)
+        self.right = array("i", [0] * size)
+        self.heading = array("h", [0] * size)
+        self.cmd_left = array("h", [0] * size)
+        self.cmd_right = array("h", [0] * size)
+        self.refl_left = array("B", [0] * size)
+        self.refl_right = array("B", [0] * size)
+        self.phase = array("B", [0] * size)
+        self.target = array("h", [0] * size)
+        self.line_error = array("h", [0] * size)
+        self.events = []
+        self.watch = StopWatch()
+        self.start()
+
+    def start(self):
+        """Начало миссии: время с нуля, буфер пуст"""
+        self.watch.reset()
+        self.index = 0
+        self.count = 0
+        self.skip = 0
+        del self.events[:]
+
+    def record(self):
+        """Пишет текущий такт (вызывается движком раз в такт)"""
+        if self.skip > 0:
+            self.skip -= 1
+            return
+        self.skip = self.every - 1
+        
+        i = self.index
+        self.time[i] = self.watch.time()
+        if ODOMETRY:
+            # Энкодеры этого такта уже прочитала update_pose
+            self.left[i] = _odometry_left
+            self.right[i] = _odometry_right
+        else:
+            self.left[i] = left_motor.angle()
+            self.right[i] = right_motor.angle()
+        self.heading[i] = int(last_heading * 10)
+        self.cmd_left[i] = int(cmd_left)
+        self.cmd_right[i] = int(cmd_right)
+        self.refl_left[i] = reflection_left
+        self.refl_right[i] = reflection_right
+        self.phase[i] = motion_phase
+        self.target[i] = int(target_heading * 10)
+        self.line_error[i] = line_error
+        if TRACE:
+            print(self.line(i))
+        
+        i += 1
+        self.index = i if i < self.size else 0
+        self.count += 1
+
+    def mark(self, kind, name, info):
+        """Начало (S) или конец (E) шага миссии, событие в шаге (X)"""
+        event = "%s,%d,%d,%d,%d,%s,%s" % (
+            kind, self.watch.time(), left_motor.angle(), right_motor.angle(),
+            int(last_heading * 10), name, info)
+        self.events.append(event)
+        if TRACE:
+            print(event)
+
+    def line(self, i):
+        return "T,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d" % (
+            self.time[i], self.left[i], self.right[i], self.heading[i],
+            self.cmd_left[i], self.cmd_right[i], self.refl_left[i], self.refl_right[i],
+            self.phase[i], self.target[i], self.line_error[i])
+
+    def dump(self):
+        """Печатает буфер и шаги в консоль по порядку времени"""
+        n = min(self.count, self.size)
+        first = self.index - n if self.count <= self.size else self.index
+        print("telemetry:", self.FIELDS)
+        e = 0
+        for k in range(n):
+            i = (first + k) % self.size
+            # Шаги, начавшиеся до этого такта
+            while e < len(self.events) and int(self.events[e].split(",")[1]) <= self.time[i]:
+                print(self.events[e])
+                e += 1
+            print(self.line(i))
+        for event in self.events[e:]:
+            print(event)
+
+
+def describe(args, kwargs):
+    """Аргументы шага одной строкой без запятых (для телеметрии)"""
+    parts = []
+    for value in args:
+        parts.append(describe_value(value))
+    for key in kwargs:
+        parts.append(key + "=" + describe_value(kwargs[key]))
+    return " ".join(parts)
+
+
+def describe_value(value):
+    if isinstance(value, (int, float, str)):
+        return str(value)
+    if isinstance(value, tuple):
+        return "/".join([describe_value(v) for v in value])
+    return type(value).__name__
+
+
+telemetry = Telemetry() if TELEMETRY else None
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ЗАДАЧИ (ПАРАЛЛЕЛЬНОЕ ВЫПОЛНЕНИЕ)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Task:
+    """Запущенный примитив: генератор, который продвигается раз в такт"""
+
+    def __init__(self, gen):
+        self.gen = gen
+        self.done = False
+        self.result = None
+
+    def step(self):
+        try:
+            next(self.gen)
+        except StopIteration as e:
+            self.done = True
+            self.result = e.value
+
+    def cancel(self):
+        if not self.done:
+            self.gen.close()
+            self.done = True
+
+
+# Фоновые задачи, запущенные через start()
+background = []
+
+
+class Primitive:
+    """
+    Примитив движения: генератор, который делает один такт за yield
+
+    Обычный вызов блокирует до конца (как раньше), а start() запускает
+    тот же примитив фоном, пока робот делает следующие шаги.
+
+    Пример:
+        @Primitive
+        def my_move(distance):
+            while abs(left_motor.angle()) < distance:
+                left_motor.run(300)
+                yield
+
+        my_move(500)                  # ждёт окончания
+        task = start(my_move, 500)    # фоном
+    """
+
+    def __init__(self, gen):
+        self.gen = gen
+        self.name = gen.__name__
+
+    def __call__(self, *args, **kwargs):
+        global motion_phase
+        motion_phase = 0
+        if telemetry:
+            telemetry.mark("S", self.name, describe(args, kwargs))
+        result = run(self.gen(*args, **kwargs))
+        if telemetry:
+            t = Ticker.last
+            telemetry.mark("E", self.name, "%d %d %d %.1f %d" % (
+                t.ticks, t.overruns, t.jitter_min, t.jitter_avg(), t.jitter_max))
+        return result
+
+
+def run(gen):
+    """
+    Выполняет генератор до конца, продвигая в каждом такте и фоновые задачи
+
+    Проверка остановки одна на такт для всех задач: при StopMission
+    (или любой ошибке) все задачи отменяются.
+    """
+    main = Task(gen)
+    ticker = Ticker()
+    try:
+        while True:
+            check_stop()
+            main.step()
+            for task in background:
+                task.step()
+            for task in [t for t in background if t.done]:
+                background.remove(task)
+            if ODOMETRY:
+                update_pose()
+            if telemetry:
+                telemetry.record()
+            if main.done:
+                return main.result
+            ticker.tick()
+    except:
+        main.cancel()
+        cancel_all()
+        raise
+
+
+def start(primitive, *args, **kwargs):
+    """
+    Запускает примитив фоном и возвращает задачу
+
+    Пример:
+        arm = start(rotate, motor_b, 90)
+        gyro_straight_accel(500)      # рука едет одновременно
+        join(arm)
+    """
+    task = Task(primitive.gen(*args, **kwargs))
+    background.append(task)
+    return task
+
+
+def _wait_tasks(tasks):
+    while [t for t in tasks if not t.done]:
+        yield
+
+
+def join(*tasks):
+    """Ждёт окончания задач; возвращает результат (или список результатов)"""
+    run(_wait_tasks(tasks))
+    if len(tasks) == 1:
+        return tasks[0].result
+    return [t.result for t in tasks]
+
+
+def join_all():
+    """Ждёт все фоновые задачи"""
+    run(_wait_tasks(list(background)))
+
+
+def cancel_all():
+    """Отменяет все фоновые задачи и останавливает моторы"""
+    for task in background:
+        task.cancel()
+    del background[:]
+    stop_all_motors()
+
+
+@Primitive
+def pause(duration_ms):
+    """wait(), при котором фоновые задачи продолжают работать"""
+    watch = StopWatch()
+    while watch.time() < duration_ms:
+        yield
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         КУРС
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Курс-цель миссии в градусах поля. Гироскоп сбрасывается один раз
+# в начале миссии, а каждое движение держит/меняет эту цель - ошибки
+# не копятся от шага к шагу.
+target_heading = 0
+
+
+# Последний прочитанный курс (для телеметрии - без лишнего чтения IMU)
+last_heading = 0
+heading_fresh = False   # курс читали в этом такте (сбрасывает update_pose)
+
+# Поправка гироскопа: градусов поля на градус хаба и уход показаний в
+# покое (°/с хаба). Меряет calibrate_gyro() (пункт меню "G"), хранится
+# в памяти хаба; уход вычитается по времени с reset_heading.
+GYRO_FORMAT = "<ff"         # масштаб, уход °/с
+GYRO_CAL_STILL = 3000       # мс покоя для замера ухода
+GYRO_CAL_TURNS = 3          # оборотов на месте
+GYRO_CAL_SPEED = 200        # град/с колеса
+GYRO_CAL_WINDOW = 20        # ° - вход на линию дальше от целого оборота - другое пересечение
+GYRO_CAL_TIMEOUT = 30000    # мс на обороты
+GYRO_CAL_LIMIT = 0.05       # масштаб дальше от 1 - ошибка калибровки
+
+gyro_scale = GYRO_SCALE
+gyro_bias = 0.0
+heading_watch = StopWatch()
+
+
+def get_heading():
+    """Курс робота в градусах поля (поправка гироскопа применяется только здесь)"""
+    global last_heading, heading_fresh
+    raw = hub.imu.heading()
+    if gyro_bias:
+        raw -= gyro_bias * heading_watch.time() / 1000
+    last_heading = raw * gyro_scale
+    heading_fresh = True
+    return last_heading
+
+
+def get_heading_rate():
+    """Скорость поворота, °/с поля (знак как у get_heading)"""
+    return (-hub.imu.angular_velocity(Axis.Z) - gyro_bias) * gyro_scale
+
+
+def reset_heading(angle=0):
+    """Начало миссии: робот стоит по курсу angle"""
+    global target_heading
+    hub.imu.reset_heading(angle / gyro_scale)
+    heading_watch.reset()
+    target_heading = angle
+
+
+def load_gyro():
+    """Масштаб и уход гироскопа из памяти хаба (если калибровали)"""
+    global gyro_scale, gyro_bias
+    saved = load_settings(STORAGE_GYRO, GYRO_FORMAT)
+    if saved:
+        gyro_scale, gyro_bias = saved
+
+
+@Primitive
+def calibrate_gyro(sensor=None, turns=GYRO_CAL_TURNS):
+    """
+    Калибровка гироскопа по линии поля
+    
+    Робот стоит GYRO_CAL_STILL мс - уход показаний в покое, затем крутится
+    на месте turns оборотов. Датчик (по умолчанию левый) описывает круг и
+    пересекает линию; вход на чёрное в том же месте круга - ровно целый
+    оборот, поэтому масштаб - 360·turns к показанию гироскопа между первым
+    и последним таким входом. Робот ставят так, чтобы круг датчика
+    пересекал линию, а сам датчик стоял на белом. Отражение должно быть
+    откалибровано (пункт "L").
+    """
+    global gyro_scale, gyro_bias
+    side = 1 if sensor is sensor_right else 0
+    sensor = sensor or sensor_left
+    brake_wheels()
+    watch = StopWatch()
+    h0 = hub.imu.heading()
+    while watch.time() < GYRO_CAL_STILL:
+        yield
+    bias = (hub.imu.heading() - h0) * 1000 / watch.time()
+    
+    watch.reset()
+    first = None
+    black = False
+    while True:
+        if watch.time() > GYRO_CAL_TIMEOUT:
+            brake_wheels()
+            raise ValueError("нет линии под датчиком")
+        value = sensor.reflection()
+        if not black and value < black_threshold[side]:
+            black = True
+            raw = hub.imu.heading() - bias * watch.time() / 1000
+            if first is None:
+                first = raw
+            else:
+                turned = abs(raw - first) * gyro_scale / 360
+                if round(turned) >= turns and abs(turned - round(turned)) * 360 < GYRO_CAL_WINDOW:
+                    break
+        elif black and value > white_threshold[side]:
+            black = False
+        drive(-GYRO_CAL_SPEED, GYRO_CAL_SPEED)
+        yield
+    brake_wheels()
+    
+    scale = 360 * turns / abs(raw - first)
+    print("gyro scale", scale, "bias", bias)
+    if abs(scale - 1) > GYRO_CAL_LIMIT:
+        raise ValueError("масштаб гироскопа вне допуска - линия не та?")
+    gyro_scale = scale
+    gyro_bias = bias
+    save_settings(STORAGE_GYRO, GYRO_FORMAT, scale, bias)
+    return scale, bias
+
+
+load_gyro()
+
+
+def nearest_heading(heading):
+    """
+    Курс поля heading в отсчёте гироскопа: heading + 360·k, ближайший к
+    текущему курсу
+    
+    Гироскоп и target_heading не сворачиваются в ±180 (после двух
+    gyro_turn(180) оба - 360), поэтому абсолютные курсы (turn_to, face,
+    aim) переводятся сюда, и все потребители цели считают в одном отсчёте.
+    """
+    return heading + 360 * round((get_heading() - heading) / 360)
+
+
+def aim(heading=None):
+    """Курс для движения: абсолютный heading или текущая цель миссии"""
+    global target_heading
+    if heading is not None:
+        target_heading = nearest_heading(heading)
+    return target_heading
+
+
+def settle_heading():
+    """
+    Принимает фактический курс за цель (после drift, выравнивания)
+    
+    Вызывать, когда робот стоит (wait_stopped): на докате курс ещё меняется.
+    """
+    global target_heading
+    target_heading = get_heading()
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ОДОМЕТРИЯ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Поза робота на поле: x, y в мм и курс гироскопа. Путь - среднее двух
+# энкодеров, направление - гироскоп (курс по разнице колёс плывёт от
+# проскальзывания). x - по курсу 0, y - влево от него (курс растёт
+# против часовой, как у гироскопа). Движок обновляет позу каждый такт; курс
+# читается заново, только если его не прочитал примитив. Энкодеры колёс
+# примитивы не обнуляют - только запоминают начало движения.
+ODOMETRY = True
+MM_PER_DEGREE = pi * WHEEL_DIAMETER / 360
+
+pose_x = 0.0
+pose_y = 0.0
+_odometry_left = 0
+_odometry_right = 0
+_odometry_heading = 0.0
+
+
+def set_pose(x, y, heading=None):
+    """
+    Задаёт позу робота (мм; курс - как reset_heading, если указан)
+    
+    Пример:
+        set_pose(150, 300, 0)   # старт миссии в базе
+    """
+    global pose_x, pose_y, _odometry_left, _odometry_right, _odometry_heading
+    if heading is not None:
+        reset_heading(heading)
+    pose_x = x
+    pose_y = y
+    _odometry_left = left_motor.angle()
+    _odometry_right = right_motor.angle()
+    _odometry_heading = get_heading()
+
+
+def update_pose():
+    """Продвигает позу на путь колёс с прошлого вызова (движок - раз в такт)"""
+    global pose_x, pose_y, _odometry_left, _odometry_right, _odometry_heading, heading_fresh
+    heading = last_heading if heading_fresh else get_heading()
+    heading_fresh = False
+    left = left_motor.angle()
+    right = right_motor.angle()
+    distance = (left - _odometry_left + right - _odometry_right) * MM_PER_DEGREE / 2
+    if distance:
+        middle = (heading + _odometry_heading) * pi / 360  # середина дуги, рад
+        pose_x += distance * cos(middle)
+        pose_y += distance * sin(middle)
+    _odometry_left = left
+    _odometry_right = right
+    _odometry_heading = heading
+
+
+def get_pose():
+    """(x мм, y мм, курс °)"""
+    return pose_x, pose_y, last_heading
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         БАТАРЕЯ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Предел скорости и ускорение мотора падают вместе с напряжением батареи.
+# Профили пишутся под полную батарею, а compile_profile() и rotate()
+# ограничивают их тем, что мотор даст сейчас: скорость - не выше speed_cap,
+# ускорение разгонов - не выше подобранного при BATTERY_REF_MV, умноженного
+# на accel_factor. Запланированный профиль совпадает с фактическим, поэтому
+# время шагов и предсказание доката не зависят от заряда.
+BATTERY_COMPENSATION = True
+MOTOR_SPEED_PER_VOLT = 131  # град/с на вольт - предел мотора (1050 при 8 В)
+MOTOR_ACCEL = 4000          # град/с² - разгон мотора при BATTERY_REF_MV
+SPEED_MARGIN = 50           # град/с ниже предела - запас на поправку курса
+BATTERY_REF_MV = 8000       # мВ, при которых подобраны разгоны миссий
+BATTERY_CHECK_PERIOD = 5000 # мс - не чаще читаем напряжение в миссии
+BATTERY_FILTER = 0.5        # вес нового чтения (просадка под нагрузкой скачет)
+LOG_BATTERY = False         # печатать поправку при каждом чтении
+
+battery_mv = 8000       # напряжение батареи (читается в launch)
+speed_cap = 1000        # град/с - выше профили не планируем
+accel_factor = 1.0      # доля ускорения при BATTERY_REF_MV
+battery_watch = StopWatch()
+
+# (мВ, speed_cap, accel_factor) каждого чтения в миссии (очищается в launch)
+battery_log = []
+
+
+def read_battery(fresh=True):
+    """
+    Напряжение батареи -> battery_mv, предел скорости и поправка торможения
+    
+    fresh - начало миссии: берём чтение как есть, иначе сглаживаем.
+    """
+    global battery_mv, speed_cap, accel_factor
+    voltage = hub.battery.voltage()
+    battery_mv = voltage if fresh else int(battery_mv + (voltage - battery_mv) * BATTERY_FILTER)
+    battery_watch.reset()
+    speed_cap = MOTOR_SPEED_PER_VOLT * battery_mv // 1000 - SPEED_MARGIN
+    accel_factor = min(1.0, battery_mv / BATTERY_REF_MV)
+    update_brake_model()
+    battery_log.append((battery_mv, speed_cap, accel_factor))
+    if LOG_BATTERY:
+        print("battery", battery_mv, "mV, speed cap", speed_cap, "accel", accel_factor)
+
+
+def check_battery():
+    """Перечитывает напряжение раз в BATTERY_CHECK_PERIOD (в начале движения)"""
+    if battery_watch.time() >= BATTERY_CHECK_PERIOD:
+        read_battery(False)
+
+
+def ramp_length(length, low, high, top):
+    """
+    Путь разгона low -> high (град колеса), пересчитанный под батарею
+    
+    Разгон только до top с тем же ускорением (у трапеции оно
+    (high² - low²) / 2·length). Если мотор сейчас так не разгонится,
+    ускорение падает вместе с батареей (accel_factor) - как и у мотора.
+    """
+    if not length or high <= low:
+        return length
+    top = max(top, low)
+    length = length * (top * top - low * low) / (high * high - low * low)
+    if accel_factor < 1 and top * top - low * low > 2 * length * MOTOR_ACCEL * accel_factor:
+        length /= accel_factor
+    return length
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ПРОБУКСОВКА
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# На резком разгоне колёса могут буксовать: энкодеры бегут впереди робота,
+# и путь по ним завышен. Разгоны прямых и drift сверяют скорость колёс с
+# ускорением корпуса по IMU (SlipWatch); при пробуксовке разгон этого
+# движения ограничивается тем, что пол реально даёт, пробуксованный путь
+# вычитается из пройденного, а в результате движения - "slip".
+SLIP_DETECT = True
+IMU_FORWARD = 1         # знак оси X хаба по ходу робота (как хаб стоит на роботе)
+SLIP_MARGIN = 80        # град/с - колёса быстрее корпуса на столько - буксуют
+SLIP_CONFIRM = 3        # тактов подряд
+SLIP_BLEND = 0.05       # подтяжка оценки корпуса к колёсам за такт без пробуксовки
+SLIP_BACKOFF = 0.8      # доля ускорения корпуса, с которой разгон идёт дальше
+SLIP_MIN_ACCEL = 500    # град/с² - не медленнее, даже если IMU показал меньше
+SLIP_MAX_LOST = 0.5     # доля пути колёс - больше не вычитаем (ошибка IMU не остановит робота)
+LOG_SLIP = False        # печатать каждое движение с пробуксовкой
+
+# (примитив, тактов с пробуксовкой, потерянный путь, град) каждого движения
+# миссии с пробуксовкой (очищается в launch)
+slip_log = []
+
+
+class SlipWatch:
+    """
+    Пробуксовка колёс за одно движение
+    
+    update() каждый такт, пока движение разгоняется: скорость колёс
+    (motor.speed) против скорости корпуса - интеграла ускорения IMU по оси
+    хода. Пока колёса не буксуют, оценка корпуса подтягивается к ним (гасит
+    уход акселерометра); колёса обогнали её больше чем на SLIP_MARGIN
+    SLIP_CONFIRM тактов подряд - буксуют. После этого limit() не даёт
+    профилю разгоняться быстрее корпуса, а lost - путь колёс без движения
+    робота, град колеса. Разгон закончился и колёса набрали скорость -
+    update() больше не читает датчики.
+    
+    Пример:
+        slip = SlipWatch(1)
+        while ...:
+            progress = left_motor.angle() - origin - int(slip.lost)
+            speed = profile.speed(progress)
+            slip.update(speed, motion_phase == 1)
+            speed = slip.limit(speed)
+        return slip.report("my_move")
+    """
+
+    def __init__(self, direction=1):
+        self.ticks = 0
+        self.lost = 0.0
+        self.travel = 0.0       # путь колёс за проверенные такты, град
+        self.begin(direction)
+
+    def begin(self, direction):
+        """Новый участок движения (сегмент пути): скорость корпуса заново"""
+        self.direction = direction
+        self.body = None        # скорость корпуса, град колеса/с
+        self.accel = 0.0        # ускорение корпуса по IMU, град/с² (сглаженное)
+        self.count = 0
+        self.ahead = 0.0        # путь колёс впереди корпуса с начала подозрения
+        self.cap = None         # предел скорости после пробуксовки
+        self.launched = False   # разгон закончился - больше не проверяем
+
+    def update(self, speed, ramping=False):
+        """
+        Такт движения со скоростью speed (средняя колёс, по модулю);
+        ramping - профиль ещё разгоняется. True - колёса буксуют.
+        """
+        if not SLIP_DETECT or self.launched:
+            return False
+        wheel = (left_motor.speed() + right_motor.speed()) * self.direction / 2
+        if not ramping and wheel >= speed - SLIP_MARGIN:
+            self.launched = True
+            return False
+        accel = hub.imu.acceleration(Axis.X) * IMU_FORWARD * self.direction / MM_PER_DEGREE
+        self.accel += (accel - self.accel) * 0.3
+        self.travel += wheel * LOOP_PERIOD / 1000
+        if self.body is None:
+            self.body = wheel
+            return False
+        self.body += accel * LOOP_PERIOD / 1000
+        excess = wheel - self.body
+        if excess < SLIP_MARGIN / 2:
+            # Колёса идут с корпусом - гасим уход интеграла
+            self.body += excess * SLIP_BLEND
+            self.count = 0
+            self.ahead = 0.0
+            return False
+        # Подозрение: корпус больше не подтягиваем, копим обгон колёс
+        self.ahead += excess * LOOP_PERIOD / 1000
+        if excess > SLIP_MARGIN:
+            self.count += 1
+        if self.count < SLIP_CONFIRM:
+            return False
+        self.ticks += 1
+        self.lost = min(self.lost + self.ahead, self.travel * SLIP_MAX_LOST)
+        self.ahead = 0.0
+        self.cap = self.body if self.cap is None else min(self.cap, self.body)
+        return True
+
+    def limit(self, speed):
+        """Скорость профиля, но после пробуксовки - не быстрее разгона корпуса"""
+        if self.cap is None:
+            return speed
+        self.cap += max(self.accel, SLIP_MIN_ACCEL) * SLIP_BACKOFF * LOOP_PERIOD / 1000
+        return min(speed, self.cap)
+
+    def report(self, name):
+        """Итог движения {"slip": тактов с пробуксовкой, "lost": град} (и в slip_log)"""
+        lost = int(self.lost)
+        if self.ticks:
+            slip_log.append((name, self.ticks, lost))
+            if LOG_SLIP:
+                print("slip", name, "ticks", self.ticks, "lost", lost)
+        return {"slip": self.ticks, "lost": lost}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ТОРМОЖЕНИЕ
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# После brake() робот ещё докатывается, и тем дальше, чем быстрее ехал.
+# Прямые тормозят раньше цели на предсказанный докат, чтобы встать на
+# distance_degrees, а не за ней.
+#
+# Кривая торможения - докат (град колеса) со скоростей BRAKE_SPEEDS при
+# напряжении brake_voltage, между точками - линейно. calibrate_brake()
+# меряет её и сохраняет в памяти хаба. brake_scale подстраивается по
+# фактическому докату прямых, после которых робот успел остановиться.
+BRAKE_PREDICT = True
+BRAKE_SPEEDS = (0, 200, 400, 600, 800, 1000)   # град/с, через равный шаг
+BRAKE_FORMAT = "<H5H"       # мВ калибровки, докат ×10 на BRAKE_SPEEDS[1:]
+BRAKE_VOLTAGE_GAIN = 0.03   # доля доката на каждый вольт выше калибровки
+BRAKE_LEARN = 0.2           # шаг подстройки brake_scale
+BRAKE_LEARN_MIN = 5         # град - по меньшему докату не учимся (шум энкодера)
+BRAKE_STOPPED_SPEED = 10    # град/с - колесо остановилось
+BRAKE_WATCH_TIME = 400      # мс - дольше докат не ждём
+BRAKE_CAL_TIMEOUT = 2000    # мс на разгон до скорости калибровки
+LOG_BRAKES = False          # печатать ошибку остановки каждой прямой
+
+brake_curve = [0, 2, 8, 17, 29, 45]  # оценка до первой калибровки
+brake_voltage = 8000
+brake_scale = 1.0
+brake_factor = 1.0      # brake_scale с поправкой на батарею
+brake_lookahead = 60    # наибольший докат: ближе к цели сверяем скорость
+
+# (дистанция, скорость, предсказанный докат, докат, ошибка остановки) каждой
+# прямой миссии; None - следующий шаг поехал раньше остановки (очищается в launch)
+brake_log = []
+
+
+def update_brake_model():
+    """Пересчитывает поправку на батарею и дальность проверки доката"""
+    global brake_factor, brake_lookahead
+    brake_factor = brake_scale * (1 + BRAKE_VOLTAGE_GAIN * (battery_mv - brake_voltage) / 1000)
+    brake_lookahead = brake_distance(BRAKE_SPEEDS[-1] * 1.2) + 5
+
+
+def load_brake():
+    """Кривая торможения из памяти хаба (если калибровали)"""
+    global brake_voltage
+    saved = load_settings(STORAGE_BRAKE, BRAKE_FORMAT)
+    if saved:
+        brake_voltage = saved[0]
+        brake_curve[1:] = [d / 10 for d in saved[1:]]
+    update_brake_model()
+
+
+def brake_distance(speed):
+    """Предсказанный докат после brake() со скорости speed, град колеса"""
+    speed = abs(speed)
+    step = BRAKE_SPEEDS[1]
+    i = min(int(speed // step), len(BRAKE_SPEEDS) - 2)  # выше кривой - продолжаем последний отрезок
+    low = brake_curve[i]
+    return (low + (brake_curve[i + 1] - low) * (speed - BRAKE_SPEEDS[i]) / step) * brake_factor
+
+
+def brake_point(progress, distance):
+    """
+    Пора тормозить: путь пройден или докат довезёт до distance
+
+    Скорость колеса читается только в последних brake_lookahead градусах.
+    Полтакта - в среднем столько проедем до следующей проверки.
+    """
+    remaining = distance - progress
+    if remaining <= 0:
+        return True
+    if not BRAKE_PREDICT or remaining > brake_lookahead:
+        return False
+    speed = abs(left_motor.speed())
+    return remaining <= brake_distance(speed) + speed * LOOP_PERIOD / 2000
+
+
+def brake_wheels():
+    """brake() обоих колёс, команды колёс - ноль"""
+    global cmd_left, cmd_right
+    cmd_left = cmd_right = 0
+    left_motor.brake()
+    right_motor.brake()
+
+
+def wait_stopped():
+    """Ждёт, пока оба колеса остановятся (не дольше BRAKE_WATCH_TIME)"""
+    watch = StopWatch()
+    while watch.time() < BRAKE_WATCH_TIME and (abs(left_motor.speed()) > BRAKE_STOPPED_SPEED or
+                                              abs(right_motor.speed()) > BRAKE_STOPPED_SPEED):
+        yield
+
+
+def stop_straight(progress, distance, direction):
+    """
+    Тормозит прямую и фоном меряет докат (watch_landing)
+
+    progress - путь левого колеса в момент торможения, direction - 1 вперёд,
+    -1 назад. Докат меряется по правому колесу.
+    """
+    speed = abs(left_motor.speed())
+    brake_wheels()
+    start(watch_landing, progress, distance, direction, speed, right_motor.angle())
+
+
+@Primitive
+def watch_landing(progress, distance, direction, speed, start_right):
+    """Фоном ждёт остановки после stop_straight: ошибка в brake_log, подстройка brake_scale"""
+    global brake_scale
+    predicted = brake_distance(speed)
+    watch = StopWatch()
+    settled = False
+    while watch.time() < BRAKE_WATCH_TIME:
+        yield
+        if cmd_left or cmd_right:
+            break  # следующий шаг уже едет - докат не измерить
+        if abs(right_motor.speed()) < BRAKE_STOPPED_SPEED:
+            settled = True
+            break
+    if not settled:
+        brake_log.append((distance, speed, predicted, None, None))
+        return
+    roll = (right_motor.angle() - start_right) * direction
+    error = progress + roll - distance
+    brake_log.append((distance, speed, predicted, roll, error))
+    if LOG_BRAKES:
+        print("brake", distance, "speed", speed, "roll", roll, "predicted", int(predicted), "error", error)
+    if predicted >= BRAKE_LEARN_MIN:
+        brake_scale += BRAKE_LEARN * (brake_scale * roll / predicted - brake_scale)
+        brake_scale = max(0.5, min(2.0, brake_scale))
+        update_brake_model()
+
+
+@Primitive
+def calibrate_brake():
+    """
+    Калибровка торможения: на каждой скорости BRAKE_SPEEDS разгон, brake()
+    и замер доката - сначала вперёд, потом назад, поэтому робот остаётся
+    на месте (нужно ~15 см свободно впереди и сзади). Кривая - среднее двух
+    направлений; сохраняется в память хаба, brake_scale сбрасывается.
+    """
+    global brake_voltage, brake_scale
+    read_battery()
+    curve = [0]
+    for speed in BRAKE_SPEEDS[1:]:
+        total = 0
+        for direction in (1, -1):
+            target = aim()
+            watch = StopWatch()
+            while abs(left_motor.speed()) < speed * 0.95 and watch.time() < BRAKE_CAL_TIMEOUT:
+                correction = heading_hold(target, speed, 3.0)
+                drive(direction * speed + correction, direction * speed - correction)
+                yield
+            reached = max(abs(left_motor.speed()), 1)
+            start_left = left_motor.angle()
+            start_right = right_motor.angle()
+            brake_wheels()
+            yield from wait_stopped()
+            roll = (left_motor.angle() - start_left + right_motor.angle() - start_right) * direction / 2
+            # Разгон останавливаем на 95% скорости - приводим докат к ней (~ v²)
+            total += roll * (speed / reached) ** 2
+        curve.append(max(curve[-1], total / 2))
+    
+    brake_curve[:] = curve
+    brake_voltage = battery_mv
+    brake_scale = 1.0
+    update_brake_model()
+    save_settings(STORAGE_BRAKE, BRAKE_FORMAT, brake_voltage, *[int(d * 10 + 0.5) for d in curve[1:]])
+    print("brake curve", [int(d) for d in curve], "at", brake_voltage, "mV")
+    return curve
+
+
+load_brake()
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 #                         ФУНКЦИИ ДВИЖЕНИЯ
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Последние команды скорости колёс (для телеметрии)
+cmd_left = 0
+cmd_right = 0
+
+
+def drive(left_speed, right_speed):
+    """Задаёт скорости колёс и запоминает их"""
+    global cmd_left, cmd_right
+    cmd_left = left_speed
+    cmd_right = right_speed
+    left_motor.run(left_speed)
+    right_motor.run(right_speed)
+
+
+# Удержание курса на прямых: PD по ошибке курса и скорости поворота (IMU),
+# P-коэффициент зависит от скорости: на быстрых прямых меньше (не виляет),
+# на медленных больше (успевает исправить)
+HOLD_REF_SPEED = 400    # град/с - на этой скорости P равен gain шага
+HOLD_MAX_SCALE = 2.0    # во сколько раз P может вырасти на малой скорости
+HOLD_KD = 0.2           # град/с колеса на °/с ошибки скорости поворота (демпфирование)
+
+
+def heading_hold(target, speed, gain, target_rate=0):
+    """
+    Поправка u для удержания курса target: drive(v + u, v - u)
+
+    Общая для всех прямых (вперёд и назад - знак один и тот же).
+
+    Args:
+        target: Курс-цель, °
+        speed: Текущая скорость прямой (по модулю), град/с
+        gain: P-коэффициент шага при HOLD_REF_SPEED
+        target_rate: Скорость изменения цели, °/с (дуга)
+    """
+    error = get_heading() - target
+    rate = get_heading_rate() - target_rate
+    scale = HOLD_REF_SPEED / speed if speed > HOLD_REF_SPEED / HOLD_MAX_SCALE else HOLD_MAX_SCALE
+    return error * gain * scale + rate * HOLD_KD
+
+
 def map_value(value, in_min, in_max, out_min, out_max):
     return (value - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
 
 def get_trapezoid_speed(progress, total, accel, decel, min_speed, max_speed, end_speed):
+    global motion_phase
+    # После поворота колесо может ещё откатиться назад: progress < 0
+    if progress < 0:
+        progress = 0
     if progress < accel:
+        motion_phase = 1
         return map_value(progress, 0, accel, min_speed, max_speed)
     elif progress > total - decel:
+        motion_phase = 3
         return map_value(progress, total - decel, total, max_speed, end_speed)
     else:
+        motion_phase = 2
         return max_speed
 
 
-def gyro_straight(distance_degrees, speed=300, gain=3.0):
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+# S-кривая: разгон и торможение с ограничением рывка (jerk), а не
+# мгновенной сменой ускорения на границах фаз, как у трапеции
+S_CURVE_ACCEL = 3000    # град/с² колеса - предел ускорения
+S_CURVE_JERK = 20000    # град/с³ - предел рывка
+S_CURVE_POINTS = 16     # точек в таблице одного разгона/торможения
+
+
+def ramp_times(dv, accel, jerk):
+    """Фазы S-разгона на dv: (время нарастания ускорения, время постоянного, пиковое ускорение)"""
+    if dv <= 0:
+        return 0, 0, 0
+    if dv >= accel * accel / jerk:
+        return accel / jerk, dv / accel - accel / jerk, accel
+    peak = sqrt(jerk * dv)
+    return peak / jerk, 0, peak
+
+
+def ramp_distance(v0, v1, accel, jerk):
+    """Путь S-разгона от v0 до v1 (симметричный разгон: средняя скорость посередине)"""
+    t1, t2, _ = ramp_times(v1 - v0, accel, jerk)
+    return (v0 + v1) / 2 * (2 * t1 + t2)
+
+
+def ramp_table(v0, v1, accel, jerk, points=S_CURVE_POINTS):
+    """
+    S-разгон от v0 до v1 как таблица скоростей по пути
+
+    Returns:
+        (путь разгона, [скорость в points + 1 равноотстоящих точках пути])
+    """
+    t1, t2, peak = ramp_times(v1 - v0, accel, jerk)
+    length = (v0 + v1) / 2 * (2 * t1 + t2)
+    if length <= 0:
+        return 0, [v1]
+
+    # Скорость и путь по времени (точно, по фазам), мелким шагом
+    samples = points * 4
+    total = 2 * t1 + t2
+    v2 = v0 + jerk * t1 * t1 / 2 + peak * t2
+    s1 = v0 * t1 + jerk * t1 * t1 * t1 / 6
+    s2 = s1 + (v0 + jerk * t1 * t1 / 2) * t2 + peak * t2 * t2 / 2
+    path = []
+    speed = []
+    for i in range(samples + 1):
+        t = total * i / samples
+        if t < t1:
+            v = v0 + jerk * t * t / 2
+            d = v0 * t + jerk * t * t * t / 6
+        elif t < t1 + t2:
+            tau = t - t1
+            v = v0 + jerk * t1 * t1 / 2 + peak * tau
+            d = s1 + (v0 + jerk * t1 * t1 / 2) * tau + peak * tau * tau / 2
+        else:
+            tau = t - t1 - t2
+            v = v2 + peak * tau - jerk * tau * tau / 2
+            d = s2 + v2 * tau + peak * tau * tau / 2 - jerk * tau * tau * tau / 6
+        path.append(d)
+        speed.append(v)
+
+    # Пересчёт на равные шаги пути
+    table = []
+    k = 0
+    for j in range(points + 1):
+        target = length * j / points
+        while k < samples - 1 and path[k + 1] < target:
+            k += 1
+        span = path[k + 1] - path[k]
+        f = (target - path[k]) / span if span > 0 else 0
+        table.append(speed[k] + (speed[k + 1] - speed[k]) * min(1, max(0, f)))
+    return length, table
+
+
+def table_lookup(table, length, position):
+    """Линейная интерполяция таблицы ramp_table"""
+    points = len(table) - 1
+    x = position * points / length
+    i = int(x)
+    if i >= points:
+        return table[points]
+    if i < 0:
+        return table[0]
+    return table[i] + (table[i + 1] - table[i]) * (x - i)
+
+
+class SCurve:
+    """
+    Профиль скорости по пути с ограничением рывка, ускорения и скорости
+
+    План считается один раз на движение: наибольшая скорость, с которой
+    ещё успеваем затормозить до end_speed, и таблицы разгона/торможения.
+    В такте - только поиск в таблице (speed).
+
+    Args:
+        distance: Путь, град колеса
+        start_speed, max_speed, end_speed: град/с
+        accel: Предел ускорения, град/с²
+        jerk: Предел рывка, град/с³
+    """
+
+    def __init__(self, distance, start_speed, max_speed, end_speed,
+                 accel=S_CURVE_ACCEL, jerk=S_CURVE_JERK):
+        self.distance = distance
+        peak = max(max_speed, start_speed, end_speed)
+        if ramp_distance(start_speed, peak, accel, jerk) + ramp_distance(end_speed, peak, accel, jerk) > distance:
+            # Короткий путь - не успеваем до max_speed: ищем пик делением пополам
+            low, high = max(start_speed, end_speed), peak
+            for _ in range(12):
+                middle = (low + high) / 2
+                if ramp_distance(start_speed, middle, accel, jerk) + \
+                        ramp_distance(end_speed, middle, accel, jerk) <= distance:
+                    low = middle
+                else:
+                    high = middle
+            peak = low
+        self.peak = peak
+        self.up_length, self.up = ramp_table(start_speed, peak, accel, jerk)
+        self.down_length, self.down = ramp_table(end_speed, peak, accel, jerk)
+
+    def speed(self, progress):
+        global motion_phase
+        if progress < self.up_length:
+            motion_phase = 1
+            return table_lookup(self.up, self.up_length, progress)
+        remaining = self.distance - progress
+        if remaining < self.down_length:
+            motion_phase = 3
+            return table_lookup(self.down, self.down_length, remaining)
+        motion_phase = 2
+        return self.peak
+
+
+# Таблица профиля: скорость в точках пути через 2^shift градусов, не больше
+# PROFILE_TABLE_SIZE точек. Считается один раз на движение, в такте - только
+# целочисленная интерполяция (на хабе каждая операция с float создаёт объект).
+PROFILE_TABLE_SIZE = 128
+BENCHMARK = False  # при запуске напечатать bench_profile() - цена такта на хабе
+
+
+class SpeedTable:
+    """
+    Профиль скорости, скомпилированный в array('h') по пути
+
+    Для каждой ячейки хранится скорость в её начале и в последнем градусе,
+    поэтому скачок скорости на границе ячеек (трапеция, где разгон и
+    торможение перекрываются) остаётся скачком, а не размазывается.
+
+    Args:
+        distance: Путь, град колеса
+        speed_at: Функция progress -> скорость (get_trapezoid_speed,
+            SCurve.speed), вызывается только при компиляции
+
+    Пример:
+        table = SpeedTable(500, SCurve(500, 100, 1000, 80).speed)
+        speed = table.speed(abs(left_motor.angle()))
+    """
+
+    def __init__(self, distance, speed_at):
+        global motion_phase
+        distance = int(distance)
+        shift = 2
+        while (distance >> shift) >= PROFILE_TABLE_SIZE:
+            shift += 1
+        size = (distance >> shift) + 2
+        self.shift = shift
+        self.mask = (1 << shift) - 1
+        self.last = size - 1
+        self.speeds = array("h", [0] * size)
+        self.ends = array("h", [0] * size)
+        self.phases = array("B", [0] * size)
+        for i in range(size):
+            self.speeds[i] = int(speed_at(min(i << shift, distance)))
+            self.phases[i] = motion_phase
+            self.ends[i] = int(speed_at(min((i << shift) + self.mask, distance)))
+        motion_phase = 0
+
+    def speed(self, progress):
+        """Скорость в точке пути progress (целое, град)"""
+        global motion_phase
+        if progress < 0:
+            progress = 0
+        i = progress >> self.shift
+        if i >= self.last:
+            motion_phase = self.phases[self.last]
+            return self.speeds[self.last]
+        motion_phase = self.phases[i]
+        low = self.speeds[i]
+        return low + (self.ends[i] - low) * (progress & self.mask) // self.mask
+
+
+def compile_profile(distance, accel, decel, min_speed, max_speed, end_speed,
+                    jerk=None, max_accel=S_CURVE_ACCEL):
+    """Таблица трапеции (или S-кривой при jerk) для одного движения"""
+    if BATTERY_COMPENSATION:
+        check_battery()
+        top = min(max_speed, speed_cap)
+        accel = ramp_length(accel, min_speed, max_speed, top)
+        decel = ramp_length(decel, end_speed, max_speed, top)
+        min_speed = min(min_speed, top)
+        end_speed = min(end_speed, top)
+        max_speed = top
+        max_accel *= accel_factor
+    if jerk:
+        return SpeedTable(distance, SCurve(distance, min_speed, max_speed, end_speed, max_accel, jerk).speed)
+    return SpeedTable(distance, lambda progress: get_trapezoid_speed(
+        progress, distance, accel, decel, min_speed, max_speed, end_speed))
+
+
+def bench_profile(count=2000):
+    """
+    Микробенчмарк на хабе: мкс на скорость профиля формулой и по таблице
+
+    На компьютере (python -m sim.bench profile_float profile_table) разницы
+    почти нет - там float не выделяет память; мерить нужно здесь.
+    """
+    distance = 1400
+    watch = StopWatch()
+    table = compile_profile(distance, 200, 300, 100, 1000, 80)
+    compile_ms = watch.time()
+
+    watch.reset()
+    for i in range(count):
+        get_trapezoid_speed(i * 5 % distance, distance, 200, 300, 100, 1000, 80)
+    formula_us = watch.time() * 1000 / count
+
+    watch.reset()
+    for i in range(count):
+        table.speed(i * 5 % distance)
+    table_us = watch.time() * 1000 / count
+
+    print("profile: formula %.1f us, table %.1f us per tick, compile %d ms" % (
+        formula_us, table_us, compile_ms))
+    return formula_us, table_us
+
+
+@Primitive
+def gyro_straight(distance_degrees, speed=300, gain=3.0, heading=None):
+    target = aim(heading)
+    origin = left_motor.angle()
     
-    while abs(left_motor.angle()) < distance_degrees:
-        check_stop()  # Проверка остановки
-        
-        heading = hub.imu.heading()
-        correction = heading * -1 * gain
-        left_motor.run(speed - correction)
-        right_motor.run(speed + correction)
-        wait(10)
+    while True:
+        progress = left_motor.angle() - origin
+        if brake_point(progress, distance_degrees):
+            break
+        correction = heading_hold(target, speed, gain)
+        drive(speed + correction, speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, 1)
 
 
+@Primitive
 def gyro_straight_accel(distance_degrees, accel=200, decel=200, 
-                        min_speed=100, max_speed=800, end_speed=100, gain=3.0):
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+                        min_speed=100, max_speed=800, end_speed=100, gain=3.0,
+                        heading=None, jerk=None, max_accel=S_CURVE_ACCEL):
+    """
+    jerk - S-кривая вместо трапеции: разгон от min_speed до max_speed и
+    торможение до end_speed с рывком не больше jerk (град/с³) и ускорением
+    не больше max_accel (град/с²); accel и decel тогда не используются
+    """
+    target = aim(heading)
+    profile = compile_profile(distance_degrees, accel, decel, min_speed, max_speed, end_speed, jerk, max_accel)
+    origin = left_motor.angle()
+    slip = SlipWatch(1)
     
-    while abs(left_motor.angle()) < distance_degrees:
-        check_stop()  # Проверка остановки
-        
-        progress = abs(left_motor.angle())
-        speed = get_trapezoid_speed(progress, distance_degrees, accel, decel, min_speed, max_speed, end_speed)
-        heading = hub.imu.heading()
-        correction = heading * -1 * gain
-        left_motor.run(speed - correction)
-        right_motor.run(speed + correction)
-        wait(10)
+    while True:
+        progress = left_motor.angle() - origin - int(slip.lost)
+        if brake_point(progress, distance_degrees):
+            break
+        speed = profile.speed(progress)
+        slip.update(speed, motion_phase == 1)
+        speed = slip.limit(speed)
+        correction = heading_hold(target, speed, gain)
+        drive(speed + correction, speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, 1)
+    return slip.report("gyro_straight_accel")
 
 
-def gyro_back(distance_degrees, speed=300, gain=3.0):
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+@Primitive
+def gyro_back(distance_degrees, speed=300, gain=3.0, heading=None):
+    target = aim(heading)
+    origin = left_motor.angle()
     
-    while left_motor.angle() > -distance_degrees:
-        check_stop()  # Проверка остановки
-        
-        heading = hub.imu.heading()
-        correction = heading * gain
-        left_motor.run(-speed + correction)
-        right_motor.run(-speed - correction)
-        wait(10)
+    while True:
+        progress = origin - left_motor.angle()
+        if brake_point(progress, distance_degrees):
+            break
+        correction = heading_hold(target, speed, gain)
+        drive(-speed + correction, -speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, -1)
 
 
+@Primitive
 def gyro_back_accel(distance_degrees, accel=200, decel=200,
-                    min_speed=100, max_speed=800, end_speed=100, gain=3.0):
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+                    min_speed=100, max_speed=800, end_speed=100, gain=3.0,
+                    heading=None, jerk=None, max_accel=S_CURVE_ACCEL):
+    """
+    jerk - S-кривая вместо трапеции: разгон от min_speed до max_speed и
+    торможение до end_speed с рывком не больше jerk (град/с³) и ускорением
+    не больше max_accel (град/с²); accel и decel тогда не используются
+    """
+    target = aim(heading)
+    profile = compile_profile(distance_degrees, accel, decel, min_speed, max_speed, end_speed, jerk, max_accel)
+    origin = left_motor.angle()
+    slip = SlipWatch(-1)
     
-    while left_motor.angle() > -distance_degrees:
-        check_stop()  # Проверка остановки
-        
-        progress = abs(left_motor.angle())
-        speed = get_trapezoid_speed(progress, distance_degrees, accel, decel, min_speed, max_speed, end_speed)
-        heading = hub.imu.heading()
-        correction = heading * gain
-        left_motor.run(-speed + correction)
-        right_motor.run(-speed - correction)
-        wait(10)
+    while True:
+        progress = origin - left_motor.angle() - int(slip.lost)
+        if brake_point(progress, distance_degrees):
+            break
+        speed = profile.speed(progress)
+        slip.update(speed, motion_phase == 1)
+        speed = slip.limit(speed)
+        correction = heading_hold(target, speed, gain)
+        drive(-speed + correction, -speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, -1)
+    return slip.report("gyro_back_accel")
 
 
-def gyro_turn(target_angle, accuracy=2):
-    hub.imu.reset_heading(0)
+# Регулятор поворота на месте
+TURN_MAX_SPEED = 500    # град/с колеса
+TURN_DECEL = 1500       # °/с² курса - с таким замедлением подходим к цели
+TURN_KD = 0.5           # поправка по ошибке скорости поворота (гироскоп)
+TURN_SETTLE_RATE = 15   # °/с - считаем, что робот остановился
+TURN_TIMEOUT = 3000     # мс
+
+# Скорость колёс при повороте на месте = TURN_RATIO * скорость курса
+TURN_RATIO = AXLE_TRACK / WHEEL_DIAMETER
+
+# Метрики всех поворотов миссии (очищается в launch)
+turn_log = []
+
+
+def turn_toward(target, accuracy=2, max_speed=TURN_MAX_SPEED):
+    """
+    Поворот на месте до курса поля target
     
-    # Коррекция под гироскоп
-    adjusted_target = target_angle / GYRO_SCALE
+    Скорость курса - наибольшая, с которой ещё успеваем затормозить
+    с TURN_DECEL до цели (sqrt(2·a·ошибка)), плюс поправка по фактической
+    скорости поворота с гироскопа. Поворот заканчивается, когда курс
+    в пределах accuracy и робот почти не вращается - без wait(50).
+    Моторы после него не останавливаются - это делает вызывающий.
+    
+    Returns:
+        Метрики: время, время до входа в accuracy, перелёт, смены направления
+    """
+    global motion_phase
+    motion_phase = 4
+    watch = StopWatch()
+    direction = 1 if target > get_heading() else -1
+    stats = {"target": target, "time": 0, "reached": -1,
+             "overshoot": 0, "reversals": 0, "timeout": False}
+    last_sign = 0
     
     while True:
-        check_stop()  # Проверка остановки
+        # Без свёртки в ±180: target - в отсчёте гироскопа (gyro_turn(360) -
+        # полный оборот, абсолютные курсы - через nearest_heading)
+        error = target - get_heading()
+        rate = get_heading_rate()
+        now = watch.time()
         
-        current = hub.imu.heading()
-        error = adjusted_target - current
-        
-        if error > 180:
-            error -= 360
-        elif error < -180:
-            error += 360
+        overshoot = -error * direction
+        if overshoot > stats["overshoot"]:
+            stats["overshoot"] = overshoot
         
         if abs(error) <= accuracy:
+            if stats["reached"] < 0:
+                stats["reached"] = now
+            if abs(rate) <= TURN_SETTLE_RATE:
+                break
+            rate_wanted = 0
+        else:
+            rate_wanted = copysign(min(sqrt(2 * TURN_DECEL * abs(error)),
+                                       max_speed / TURN_RATIO), error)
+        
+        if now > TURN_TIMEOUT:
+            stats["timeout"] = True
             break
         
-        if abs(error) > 30:
-            speed = 300
-        else:
-            speed = abs(error) * 3
-            if speed < 35:
-                speed = 35
+        # Смена направления вращения робота (не команды)
+        if abs(rate) > TURN_SETTLE_RATE:
+            sign = 1 if rate > 0 else -1
+            if last_sign and sign != last_sign:
+                stats["reversals"] += 1
+            last_sign = sign
         
-        if error > 0:
-            left_motor.run(-speed)
-            right_motor.run(speed)
-        else:
-            left_motor.run(speed)
-            right_motor.run(-speed)
+        speed = TURN_RATIO * (rate_wanted + TURN_KD * (rate_wanted - rate))
+        speed = max(-max_speed, min(max_speed, speed))
         
-        wait(10)
+        drive(-speed, speed)
+        yield
     
-    left_motor.stop()
-    right_motor.stop()
-    wait(50)
+    stats["time"] = watch.time()
+    turn_log.append(stats)
+    return stats
+
 
+@Primitive
+def gyro_turn(target_angle, accuracy=2):
+    """Поворот на target_angle от курса-цели (не от фактического курса)"""
+    global target_heading
+    target_heading += target_angle
+    
+    stats = yield from turn_toward(target_heading, accuracy)
+    
+    brake_wheels()
+    return stats
 
+
+@Primitive
+def turn_to(heading, accuracy=2):
+    """
+    Поворот на абсолютный курс поля
+    
+    Пример:
+        turn_to(-90)  # Курс -90° от стартового, сколько бы ни повернули до этого
+    """
+    return (yield from gyro_turn.gen(nearest_heading(heading) - target_heading, accuracy))
+
+
+@Primitive
 def drift(duration_ms, turn_rate=0.5, speed=300, backward=False):
     direction = -1 if backward else 1
     
@@ -191,48 +1560,107 @@ def drift(duration_ms, turn_rate=0.5, speed=300, backward=False):
         left_speed = direction * speed * (1 + turn_rate)
         right_speed = direction * speed
     
-    left_motor.run(left_speed)
-    right_motor.run(right_speed)
+    drive(left_speed, right_speed)
     
-    # Проверка остановки во время drift
-    timer = 0
-    while timer < duration_ms:
-        check_stop()
-        wait(10)
-        timer += 10
+    # drift идёт по времени: скорость не ограничиваем (проехал бы меньше),
+    # пробуксовку старта только отмечаем в результате
+    slip = SlipWatch(direction)
+    mean = abs(left_speed + right_speed) / 2
+    watch = StopWatch()
+    while watch.time() < duration_ms:
+        slip.update(mean)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    brake_wheels()
+    # drift поворачивает робота - новый курс становится целью
+    yield from wait_stopped()
+    settle_heading()
+    return slip.report("drift")
 
 
-def rotate(motor, target_angle, min_speed=50, max_speed=1000):
+# Навесные моторы (rotate): разгон профилем по положению, торможение -
+# track_target (регулятор положения мотора тормозит полным моментом,
+# быстрее, чем run() со своим ограничением ускорения)
+ROTATE_ACCEL = 4000      # град/с² - разгон от min_speed
+ROTATE_DECEL = 10000     # град/с² - торможение track_target (лёгкая рука)
+ROTATE_TOLERANCE = 3     # град - рука у цели
+ROTATE_STALL_TIME = 200  # мс без движения при разгоне - упёрлась
+ROTATE_TIMEOUT = 1000    # мс сверх удвоенного времени на max_speed
+
+
+@Primitive
+def rotate(motor, target_angle, min_speed=50, max_speed=1000, timeout=None):
+    """
+    Поворачивает навесной мотор на target_angle от текущего положения
+    
+    Разгоняется от min_speed с ROTATE_ACCEL до max_speed; как только
+    до цели осталось столько, сколько нужно на торможение с ROTATE_DECEL,
+    отдаёт цель track_target и ждёт руку у цели (ROTATE_TOLERANCE).
+    
+    Если рука упёрлась или прошло timeout мс (по умолчанию - вдвое
+    дольше, чем на max_speed, плюс ROTATE_TIMEOUT) - мотор держит там,
+    где стоит, а миссия идёт дальше. Упор при разгоне - энкодер не сдвинулся
+    за ROTATE_STALL_TIME (run() каждый такт - новая команда, и stalled()
+    прошивки может не успеть сработать), при торможении - motor.stalled().
+    
+    Returns:
+        {"result": "done" | "stalled" | "timeout", "angle": угол мотора,
+         "time": мс}
+    """
     motor.reset_angle(0)
-    total_distance = abs(target_angle)
     direction = 1 if target_angle > 0 else -1
+    distance = abs(target_angle)
+    accel = ROTATE_ACCEL
+    decel = ROTATE_DECEL
+    if BATTERY_COMPENSATION:
+        check_battery()
+        max_speed = min(max_speed, speed_cap)
+        accel *= accel_factor
+        decel *= accel_factor
+    if timeout is None:
+        timeout = 2000 * distance // max_speed + ROTATE_TIMEOUT
+    watch = StopWatch()
+    tracking = False
+    result = "done"
+    moved_angle = 0
+    moved_at = 0
     
     while True:
-        check_stop()  # Проверка остановки
-        
-        current_angle = motor.angle()
-        
-        if (direction == 1 and current_angle >= target_angle) or \
-           (direction == -1 and current_angle <= target_angle):
+        angle = motor.angle()
+        now = watch.time()
+        remaining = (target_angle - angle) * direction
+        if tracking and abs(remaining) <= ROTATE_TOLERANCE:
+            break
+        if now > timeout:
+            result = "timeout"
+            break
+        if angle != moved_angle:
+            moved_angle = angle
+            moved_at = now
+        if (motor.stalled() if tracking else now - moved_at > ROTATE_STALL_TIME):
+            result = "stalled"
             break
         
-        traveled = abs(current_angle)
-        if total_distance > 0:
-            progress = traveled / total_distance
-            speed = min_speed + (max_speed - min_speed) * progress
-        else:
-            speed = min_speed
-        
-        motor.run(direction * speed)
-        wait(10)
+        if not tracking:
+            speed = min(max_speed, sqrt(min_speed * min_speed + 2 * accel * max(0, distance - remaining)))
+            if remaining <= speed * speed / (2 * decel) + speed * LOOP_PERIOD / 1000:
+                motor.track_target(target_angle)
+                tracking = True
+            else:
+                motor.run(direction * speed)
+        yield
     
-    motor.hold()
+    stats = {"result": result, "angle": motor.angle(), "time": watch.time()}
+    if result != "done":
+        motor.hold()
+        if telemetry:
+            telemetry.mark("X", "rotate", "%s %d %d" % (result, target_angle, stats["angle"]))
+    return stats
 
+
+@Primitive
 def gyro_straight_with_motor(distance_degrees, motor, motor_angle, 
-                              speed=300, gain=3.0, motor_speed=500):
+                              speed=300, gain=3.0, motor_speed=500, heading=None):
     """
     Едет прямо И одновременно вращает мотор
     
@@ -247,60 +1675,56 @@ def gyro_straight_with_motor(distance_degrees, motor, motor_angle,
     Пример:
         gyro_straight_with_motor(500, motor_b, 180)  # Едет и поднимает руку
     """
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+    target = aim(heading)
+    origin = left_motor.angle()
     
     # Запускаем мотор БЕЗ ожидания (работает в фоне)
     motor.run_angle(motor_speed, motor_angle, wait=False)
     
-    while abs(left_motor.angle()) < distance_degrees:
-        check_stop()
-        
-        heading = hub.imu.heading()
-        correction = heading * -1 * gain
-        left_motor.run(speed - correction)
-        right_motor.run(speed + correction)
-        wait(10)
+    while True:
+        progress = left_motor.angle() - origin
+        if brake_point(progress, distance_degrees):
+            break
+        correction = heading_hold(target, speed, gain)
+        drive(speed + correction, speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, 1)
     
     # Ждём пока мотор закончит (если ещё не закончил)
     while not motor.done():
-        check_stop()
-        wait(10)
+        yield
 
 
+@Primitive
 def gyro_back_with_motor(distance_degrees, motor, motor_angle,
-                          speed=300, gain=3.0, motor_speed=500):
+                          speed=300, gain=3.0, motor_speed=500, heading=None):
     """
     Едет назад И одновременно вращает мотор
     
     Пример:
         gyro_back_with_motor(500, motor_b, -90)  # Едет назад и опускает руку
     """
-    hub.imu.reset_heading(0)
-    left_motor.reset_angle(0)
+    target = aim(heading)
+    origin = left_motor.angle()
     
     motor.run_angle(motor_speed, motor_angle, wait=False)
     
-    while left_motor.angle() > -distance_degrees:
-        check_stop()
-        
-        heading = hub.imu.heading()
-        correction = heading * gain
-        left_motor.run(-speed + correction)
-        right_motor.run(-speed - correction)
-        wait(10)
+    while True:
+        progress = origin - left_motor.angle()
+        if brake_point(progress, distance_degrees):
+            break
+        correction = heading_hold(target, speed, gain)
+        drive(-speed + correction, -speed - correction)
+        yield
     
-    left_motor.brake()
-    right_motor.brake()
+    stop_straight(progress, distance_degrees, -1)
     
     while not motor.done():
-        check_stop()
-        wait(10)
+        yield
 
 
+@Primitive
 def gyro_turn_with_motor(target_angle, motor, motor_angle,
                           accuracy=2, motor_speed=500):
     """
@@ -309,51 +1733,20 @@ def gyro_turn_with_motor(target_angle, motor, motor_angle,
     Пример:
         gyro_turn_with_motor(90, motor_b, 180)  # Поворот + поднять руку
     """
-    hub.imu.reset_heading(0)
-    
-    # Коррекция под гироскоп
-    adjusted_target = target_angle / GYRO_SCALE
+    global target_heading
+    target_heading += target_angle
     
     motor.run_angle(motor_speed, motor_angle, wait=False)
     
-    while True:
-        check_stop()
-        
-        current = hub.imu.heading()
-        error = adjusted_target - current
-        
-        if error > 180:
-            error -= 360
-        elif error < -180:
-            error += 360
-        
-        if abs(error) <= accuracy:
-            break
-        
-        if abs(error) > 30:
-            speed = 300
-        else:
-            speed = abs(error) * 2.5
-            if speed < 35:
-                speed = 35
-        
-        if error > 0:
-            left_motor.run(-speed)
-            right_motor.run(speed)
-        else:
-            left_motor.run(speed)
-            right_motor.run(-speed)
-        
-        wait(10)
+    yield from turn_toward(target_heading, accuracy)
     
-    left_motor.stop()
-    right_motor.stop()
+    brake_wheels()
     
     while not motor.done():
-        check_stop()
-        wait(10)
+        yield
 
 
+@Primitive
 def move_both_motors(motor1, angle1, motor2, angle2, speed1=500, speed2=500):
     """
     Вращает ДВА мотора одновременно
@@ -373,8 +1766,7 @@ def move_both_motors(motor1, angle1, motor2, angle2, speed1=500, speed2=500):
     
     # Ждём пока оба закончат
     while not motor1.done() or not motor2.done():
-        check_stop()
-        wait(10)
+        yield
 
 
 def start_motor(motor, angle, speed=500):
@@ -389,313 +1781,878 @@ def start_motor(motor, angle, speed=500):
     motor.run_angle(speed, angle, wait=False)
 
 
+@Primitive
 def wait_motor(motor):
     """Ждёт пока мотор закончит вращение"""
     while not motor.done():
-        check_stop()
-        wait(10)
+        yield
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
-#                      ВЫРАВНИВАНИЕ ПО ЛИНИИ
+#                         ПУТЬ ИЗ СЕГМЕНТОВ
 # ═══════════════════════════════════════════════════════════════════════════════
 
-sensor_left = ColorSensor(Port.D) 
-sensor_right = ColorSensor(Port.C)
-BLACK = 15    
-WHITE = 70
+# Сегмент: (вид, дистанция, поворот, accel, decel, min_speed, max_speed, end_speed, gain)
+# Для поворота на месте: ("turn", 0, угол, accuracy) или ("face", 0, курс, accuracy)
 
-def align_two_sensors(sensor_left, sensor_right, speed=100, timeout=3000):
+def straight(distance_degrees, accel=200, decel=200,
+             min_speed=100, max_speed=800, end_speed=100, gain=3.0):
+    """Сегмент пути: вперёд (параметры как у gyro_straight_accel)"""
+    return ("straight", distance_degrees, 0, accel, decel, min_speed, max_speed, end_speed, gain)
+
+
+def back(distance_degrees, accel=200, decel=200,
+         min_speed=100, max_speed=800, end_speed=100, gain=3.0):
+    """Сегмент пути: назад (параметры как у gyro_back_accel)"""
+    return ("back", distance_degrees, 0, accel, decel, min_speed, max_speed, end_speed, gain)
+
+
+def arc(distance_degrees, angle, accel=0, decel=0,
+        min_speed=100, max_speed=400, end_speed=400, gain=3.0):
     """
-    Выравнивание по линии двумя датчиками
-    Чёрное = меньше 20
+    Сегмент пути: дуга - проезжает distance_degrees (центр робота)
+    и за это время поворачивает на angle. Назад - отрицательная дистанция.
     """
-    BLACK_THRESHOLD = 20
+    kind = "back" if distance_degrees < 0 else "straight"
+    return (kind, abs(distance_degrees), angle, accel, decel, min_speed, max_speed, end_speed, gain)
+
+
+def turn(angle, accuracy=2):
+    """Сегмент пути: поворот на месте на angle от курса-цели"""
+    return ("turn", 0, angle, accuracy)
+
+
+def face(heading, accuracy=2):
+    """Сегмент пути: поворот на месте на абсолютный курс поля"""
+    return ("face", 0, heading, accuracy)
+
+
+@Primitive
+def follow_path(*segments):
+    """
+    Едет по цепочке сегментов без торможения и сброса между ними
     
-    left_count = 0
-    right_count = 0
-    CONFIRM_COUNT = 3
+    Все сегменты держат курс-цель миссии, поэтому ошибка одного сегмента
+    исправляется в следующем. Скорость end_speed сегмента - это скорость
+    передачи следующему: если он едет в ту же сторону, его разгон
+    начинается с неё, а не с min_speed. Перед поворотом на месте и в конце
+    пути прямая тормозит с прогнозом доката (brake_point), как отдельный
+    шаг: поворот на скорости end_speed сдвигал позу.
     
-    left_done = False
-    right_done = False
-    timer = 0
+    Пример:
+        follow_path(
+            straight(1100, max_speed=650, end_speed=80, gain=5.0),
+            back(160, accel=100, decel=100, min_speed=80, end_speed=60),
+            turn(-40),
+            straight(170, decel=140, min_speed=150, max_speed=700, end_speed=80, gain=5.0),
+        )
+    """
+    global target_heading
+    # Профили всех прямых - до движения, а не на ходу между сегментами.
+    # Скорость передачи (end_speed прошлого в ту же сторону) известна заранее.
+    profiles = []
+    carry = 0  # скорость на выходе прошлого сегмента, со знаком
+    for segment in segments:
+        if segment[0] in ("turn", "face"):
+            profiles.append(None)
+            carry = 0
+            continue
+        kind, distance, angle, accel, decel, min_speed, max_speed, end_speed, gain = segment
+        direction = -1 if kind == "back" else 1
+        if carry * direction > 0:
+            min_speed = abs(carry)
+        profiles.append(compile_profile(distance, accel, decel, min_speed, max_speed, end_speed))
+        carry = direction * end_speed
+    slip = SlipWatch()
     
-    while timer < timeout:
-        check_stop()
+    last = len(segments) - 1
+    for i, segment in enumerate(segments):
+        stop = i == last or segments[i + 1][0] in ("turn", "face")
+        if segment[0] == "turn":
+            target_heading += segment[2]
+        elif segment[0] == "face":
+            target_heading = nearest_heading(segment[2])
+        if segment[0] in ("turn", "face"):
+            yield from turn_toward(target_heading, segment[3])
+            continue
         
-        left_val = sensor_left.reflection()
-        right_val = sensor_right.reflection()
+        kind, distance, angle, accel, decel, min_speed, max_speed, end_speed, gain = segment
+        direction = -1 if kind == "back" else 1
         
-        if left_val < BLACK_THRESHOLD:
-            left_count += 1
-            if left_count >= CONFIRM_COUNT:
-                left_done = True
-        else:
-            left_count = 0
-        
-        if right_val < BLACK_THRESHOLD:
-            right_count += 1
-            if right_count >= CONFIRM_COUNT:
-                right_done = True
-        else:
-            right_count = 0
+        # Разница скоростей колёс для дуги (доля от скорости)
+        track_degrees = AXLE_TRACK / WHEEL_DIAMETER * 360 / pi
+        ratio = angle * pi / 180 * track_degrees / (2 * distance) if distance else 0
         
-        if left_done and right_done:
-            break
-        
-        if left_done:
-            left_motor.brake()
-        else:
-            left_motor.run(speed)
+        profile = profiles[i]
+        # Путь центра робота - среднее колёс (на дуге колёса проезжают разное)
+        start_angle = left_motor.angle() + right_motor.angle()
+        start_heading = target_heading
+        slip.begin(direction)
+        lost = slip.lost
+        while True:
+            progress = (left_motor.angle() + right_motor.angle() - start_angle) * direction // 2 \
+                - int(slip.lost - lost)
+            if progress >= distance or stop and brake_point(progress, distance):
+                break
+            speed = profile.speed(progress)
+            slip.update(speed, motion_phase == 1)
+            speed = slip.limit(speed)
+            correction = heading_hold(start_heading + angle * progress / distance, speed, gain,
+                                      angle * speed / distance)
+            drive(direction * speed - speed * ratio + correction,
+                  direction * speed + speed * ratio - correction)
+            yield
         
-        if right_done:
-            right_motor.brake()
-        else:
-            right_motor.run(speed)
-        
-        wait(10)
-        timer += 10
+        target_heading = start_heading + angle
+        if i == last:
+            stop_straight(progress, distance, direction)
+            return slip.report("follow_path")
+        if stop:
+            brake_wheels()
     
-    left_motor.brake()
-    right_motor.brake()
+    brake_wheels()
+    return slip.report("follow_path")
 
 
-def align_two_sensors_back(sensor_left, sensor_right):
-    """
-    Выравнивание по линии НАЗАД двумя датчиками
+# Навигация по полю (go_to): дуга вместо поворота на месте, если
+# направление на цель отличается от курса не больше чем на GO_TO_ARC_ANGLE
+GO_TO_ARC_ANGLE = 20    # °
+GO_TO_MIN_DISTANCE = 5  # мм - ближе не едем, только доворачиваем
+GO_TO_RAMP = 200        # град колеса - разгон и торможение, но не больше
+GO_TO_RAMP_SHARE = 0.33 # доли пути каждое (иначе на коротком пути они перекрываются)
+
+
+def wrap_angle(angle):
+    """Угол в диапазон -180..180"""
+    while angle > 180:
+        angle -= 360
+    while angle < -180:
+        angle += 360
+    return angle
+
+
+def plan_to(x, y, heading=None, reverse=True, accuracy=2, **profile):
     """
-    left_on_line = False
-    right_on_line = False
-    timer = 0
+    Сегменты пути от текущей позы до точки (x, y) мм и курса heading
     
-    while timer < timeout:
-        check_stop()
-        
-        left_val = sensor_left.reflection()
-        right_val = sensor_right.reflection()
-        
-        if left_val < BLACK + 10:
-            left_on_line = True
-        
-        if right_val < BLACK + 10:
-            right_on_line = True
-        
-        if left_on_line and right_on_line:
-            break
-        
-        if left_on_line:
-            left_motor.brake()
-        else:
-            left_motor.run(-speed)
-        
-        if right_on_line:
-            right_motor.brake()
+    Кратчайший вариант: при малом отклонении - одна дуга по касательной к
+    курсу-цели, иначе поворот на месте и прямая; при reverse, если цель
+    сзади, - задним ходом. profile - параметры прямой (accel, max_speed...);
+    разгон и торможение по умолчанию - по длине пути (GO_TO_RAMP_SHARE).
+    """
+    dx = x - pose_x
+    dy = y - pose_y
+    distance = sqrt(dx * dx + dy * dy)
+    segments = []
+    if distance >= GO_TO_MIN_DISTANCE:
+        bearing = atan2(dy, dx) * 180 / pi
+        delta = wrap_angle(bearing - target_heading)
+        backward = reverse and abs(delta) > 90
+        if backward:
+            delta = wrap_angle(delta + 180)
+        arc_path = abs(delta) <= GO_TO_ARC_ANGLE
+        # Дуга, касательная к курсу: курс меняется на 2·delta, длина по хорде
+        half = delta * pi / 180 if arc_path else 0
+        degrees = (distance * half / sin(half) if half else distance) / MM_PER_DEGREE
+        ramp = min(GO_TO_RAMP, degrees * GO_TO_RAMP_SHARE)
+        kwargs = {"accel": ramp, "decel": ramp}
+        if arc_path:
+            kwargs.update({"max_speed": 800, "end_speed": 100})
+        kwargs.update(profile)
+        if arc_path:
+            segments.append(arc(-degrees if backward else degrees, 2 * delta, **kwargs))
         else:
-            right_motor.run(-speed)
-        
-        wait(10)
-        timer += 10
+            segments.append(face(target_heading + delta, accuracy))
+            build = back if backward else straight
+            segments.append(build(degrees, **kwargs))
+    if heading is not None:
+        segments.append(face(heading, accuracy))
+    return segments
+
+
+@Primitive
+def go_to(x, y, heading=None, reverse=True, accuracy=2, **profile):
+    """
+    Едет в точку поля (x, y) мм и, если задан, поворачивает на курс heading
     
-    left_motor.brake()
-    right_motor.brake()
+    Путь строится от позы одометрии в момент вызова (plan_to), поэтому
+    не зависит от того, как робот попал в начало шага. Переезд кончается
+    торможением с прогнозом доката (как последняя прямая follow_path);
+    на курс heading робот поворачивает, уже остановившись.
+    
+    Пример:
+        set_pose(150, 300, 0)
+        go_to(900, 450, 90, max_speed=1000)
+    """
+    segments = plan_to(x, y, None, reverse, accuracy, **profile)
+    stats = None
+    if segments:
+        stats = yield from follow_path.gen(*segments)
+        yield from wait_stopped()
+    if heading is not None:
+        yield from follow_path.gen(face(heading, accuracy))
+    return stats
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
-#                              МИССИИ
+#                      ВЫРАВНИВАНИЕ ПО ЛИНИИ
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def mission_1():
-    gyro_straight_accel(1400, accel=200, decel=300, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(-50, accuracy=3)
-    gyro_straight_accel(340, accel=200, decel=300, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(6, accuracy=3)
-    gyro_turn(-5, accuracy=3)
-    rotate(motor_b, -70, min_speed=50, max_speed=1000)
-    gyro_back(200, speed=100, gain=1.0)
-    gyro_turn(50, accuracy=3)
-    gyro_back_accel(700, accel=100, decel=100, min_speed=80, max_speed=700, end_speed=60)
-    gyro_turn(85, accuracy=3)
-    gyro_back(140, speed=1000, gain=5.0)
-    drift(700, -3, 300, True)
-    wait(300)
-    gyro_turn(100, accuracy=3)
-    gyro_straight_accel(300, accel=200, decel=300, min_speed=100, max_speed=700, end_speed=80, gain=5.0)
-    gyro_turn(-105, accuracy=3)
-    gyro_back(470, speed=1000, gain=5.0)
-
-    # gyro_straight_accel(600, accel=20, decel=30, min_speed=100, max_speed=700, end_speed=80, gain=5.0)
-    # rotate(motor_b, 60, min_speed=50, max_speed=1000)
-    # wait(500)
-    # gyro_back(470, speed=1000, gain=5.0)
-    # gyro_turn(40, accuracy=3)
-    # gyro_back(470, speed=1000, gain=5.0)
-
-
-
-
-
-
-def mission_2():
-    gyro_straight_accel(500, accel=200, decel=200, min_speed=150, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(90, 2)
-    gyro_turn(-90, 2)
-    gyro_back_accel(600, accel=200, decel=200, min_speed=150, max_speed=1000, end_speed=80, gain=5.0)
-
-
-def mission_3():
-    gyro_straight_accel(1100, accel=200, decel=200, min_speed=150, max_speed=650, end_speed=80, gain=5.0)
-    gyro_back_accel(160, accel=100, decel=100, min_speed=80, max_speed=800, end_speed=60)
-    gyro_turn(-40, accuracy=2)
-    gyro_straight_accel(170, accel=200, decel=140, min_speed=150, max_speed=700, end_speed=80, gain=5.0)
-    drift(450, -3, 1000, False)
-    wait(100)
-    gyro_turn(-50, accuracy=2)
-    gyro_straight_accel(250, accel=10, decel=30, min_speed=150, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(40, accuracy=2)
-    gyro_straight(30, 600, 5.0)
-    align_two_sensors(sensor_left, sensor_right)
-    #///////////////////////
-    wait(200)
-    gyro_back(50, 900, 4.0)
-    gyro_turn(25)
-    gyro_back(190, 900, 4.0)
-    rotate(motor_f, 90, 70, 250)
-    wait(100)
-    gyro_turn(30, 2)
-    gyro_straight(15, 400, 4.0)
-    rotate(motor_f, 100, 50, 250)
-    gyro_turn(-60)
-    gyro_straight(180, 400, 4.0)
-
-    align_two_sensors(sensor_left, sensor_right)
-    #////////////////////////
-    wait(200)
-    gyro_turn(25)
-    gyro_straight_accel(300, accel=100, decel=150, min_speed=80, max_speed=1000, end_speed=60)
+sensor_left = ColorSensor(Port.D) 
+sensor_right = ColorSensor(Port.C)
+SENSOR_SPACING = 48     # мм между датчиками поперёк робота
+SENSOR_FORWARD = 70     # мм от оси колёс вперёд до датчиков
+
+# Уровни отражения чёрного и белого у каждого датчика ([левый, правый]).
+# Чёрное - ниже порога на THRESHOLD_FRACTION пути от чёрного к белому;
+# снова белое - только выше порога ещё на HYSTERESIS_FRACTION, чтобы
+# дрожание у края линии не сбрасывало подтверждение. Уровни меряет
+# calibrate_reflection() (пункт меню "L") и сохраняет в памяти хаба.
+BLACK = 15              # до первой калибровки
+WHITE = 70
+THRESHOLD_FRACTION = 0.25
+HYSTERESIS_FRACTION = 0.1
+REFLECTION_FORMAT = "<4B"   # чёрное и белое левого, чёрное и белое правого
+REFLECTION_CAL_SPEED = 150      # град/с - проезд над линией при калибровке
+REFLECTION_CAL_DISTANCE = 400   # град колеса
+REFLECTION_MIN_CONTRAST = 20    # белое - чёрное меньше - калибровка не удалась
+
+black_level = [BLACK, BLACK]
+white_level = [WHITE, WHITE]
+black_threshold = [0, 0]    # ниже - чёрное
+white_threshold = [0, 0]    # выше - снова белое
+line_edge = [0, 0]          # середина - отражение над краем линии
+
+# Выравнивание: к линии на скорости подъезда, у линии - медленно
+ALIGN_SPEED = 400       # град/с колеса, пока датчик на белом
+ALIGN_MIN_SPEED = 60    # град/с - когда отражение у порога чёрного
+ALIGN_LOOKAHEAD = 2     # тактов - куда дойдёт отражение при том же тренде
+ALIGN_CONFIRM = max(3, 30 // LOOP_PERIOD)  # ~30 мс на чёрном
+ALIGN_MAX_DISTANCE = 600  # град колеса - дальше линии уже нет
+ALIGN_TIMEOUT = 1500    # мс сверх проезда max_distance на speed (у линии колёса медленнее)
+ALIGN_ACCURACY = 1      # ° - остаток перекоса больше - доворот по гироскопу
+
+# Метрики всех выравниваний миссии (очищается в launch)
+align_log = []
+
+# Последние прочитанные отражения (для телеметрии)
+reflection_left = 0
+reflection_right = 0
+
+
+def read_reflections(left=sensor_left, right=sensor_right):
+    """Отражение двух датчиков"""
+    global reflection_left, reflection_right
+    reflection_left = left.reflection()
+    reflection_right = right.reflection()
+    return reflection_left, reflection_right
+
+
+def update_thresholds():
+    """Пороги и края линии из уровней black_level / white_level"""
+    for i in (0, 1):
+        contrast = white_level[i] - black_level[i]
+        black_threshold[i] = black_level[i] + int(contrast * THRESHOLD_FRACTION)
+        white_threshold[i] = black_threshold[i] + int(contrast * HYSTERESIS_FRACTION)
+        line_edge[i] = black_level[i] + contrast // 2
+
+
+def load_reflection():
+    """Уровни отражения из памяти хаба (если калибровали)"""
+    saved = load_settings(STORAGE_REFLECTION, REFLECTION_FORMAT)
+    if saved:
+        black_level[:] = [saved[0], saved[2]]
+        white_level[:] = [saved[1], saved[3]]
+    update_thresholds()
+
+
+@Primitive
+def calibrate_reflection():
+    """
+    Калибровка датчиков: робот стоит на белом перед чёрной линией, проезжает
+    над ней REFLECTION_CAL_DISTANCE и возвращается. Чёрное и белое каждого
+    датчика - наименьшее и наибольшее отражение за проезд. Уровни
+    сохраняются в память хаба; при слабом контрасте - ошибка, старые
+    уровни остаются.
+    """
+    low = [100, 100]
+    high = [0, 0]
+    target = aim()
+    origin = left_motor.angle()
+    for direction in (1, -1):
+        while (left_motor.angle() - origin) * direction < (REFLECTION_CAL_DISTANCE if direction > 0 else 0):
+            values = read_reflections()
+            for i in (0, 1):
+                low[i] = min(low[i], values[i])
+                high[i] = max(high[i], values[i])
+            correction = heading_hold(target, REFLECTION_CAL_SPEED, 3.0)
+            drive(direction * REFLECTION_CAL_SPEED + correction, direction * REFLECTION_CAL_SPEED - correction)
+            yield
+    brake_wheels()
+    
+    print("reflection black", low, "white", high)
+    if min(high[0] - low[0], high[1] - low[1]) < REFLECTION_MIN_CONTRAST:
+        raise ValueError("мало контраста - датчики не над линией?")
+    black_level[:] = low
+    white_level[:] = high
+    update_thresholds()
+    save_settings(STORAGE_REFLECTION, REFLECTION_FORMAT, low[0], high[0], low[1], high[1])
+    return low, high
 
 
-    gyro_turn(-35, 2)
-    drift(570, -0.4, 700, True)
-    rotate(motor_b, 300, 700, 1000)
-    gyro_turn(-3, 2)
-    rotate(motor_b, 3000, 700, 1000)
-    rotate(motor_b, -600, 800, 1000)
+load_reflection()
 
-    gyro_turn(-60, 2)
-    gyro_straight_accel(50, accel=10, decel=10, min_speed=80, max_speed=1000, end_speed=60)
-    gyro_turn(80, 2)
-    gyro_straight(130, 500, 4.0)
-    gyro_turn(50, 2)
-    gyro_back_accel(50, accel=20, decel=20, min_speed=80, max_speed=1000, end_speed=60)
-    gyro_turn(45, 2)
-    gyro_back_accel(300, accel=20, decel=20, min_speed=80, max_speed=1000, end_speed=60)
 
-    rotate(motor_f, -180, 900, 1000)
-    rotate(motor_f, 180, 900, 1000)
-    gyro_straight_accel(170, accel=20, decel=20, min_speed=80, max_speed=1000, end_speed=60)
-    gyro_turn(-70, 2)
-    gyro_straight_accel(1400, accel=50, decel=50, min_speed=80, max_speed=1000, end_speed=60)
+def align_speed(value, last, speed, side):
+    """
+    Скорость колеса по отражению его датчика (side: 0 - левый, 1 - правый)
+    
+    Отражение берётся с упреждением по тренду (value - last за такт):
+    быстро темнеет - колесо замедляется раньше. От белого до порога
+    чёрного скорость линейно падает от speed до ALIGN_MIN_SPEED.
+    """
+    ahead = value + (value - last) * ALIGN_LOOKAHEAD
+    white = white_level[side]
+    black = black_threshold[side]
+    if ahead >= white:
+        return speed
+    if ahead <= black:
+        return ALIGN_MIN_SPEED
+    return ALIGN_MIN_SPEED + (speed - ALIGN_MIN_SPEED) * (ahead - black) // (white - black)
+
 
+def sensor_spot(side):
+    """Точка поля под датчиком по позе одометрии, мм; side - смещение датчика влево, мм"""
+    x, y, heading = get_pose()
+    a = heading * pi / 180
+    return (x + SENSOR_FORWARD * cos(a) - side * sin(a),
+            y + SENSOR_FORWARD * sin(a) + side * cos(a))
 
 
+def line_normal(spot_left, spot_right, heading):
+    """Курс поперёк линии через точки касания датчиков, ближайший к heading"""
+    normal = atan2(spot_left[1] - spot_right[1], spot_left[0] - spot_right[0]) * 180 / pi - 90
+    return normal + 360 * round((heading - normal) / 360)
 
 
+@Primitive
+def align_two_sensors(sensor_left, sensor_right, speed=ALIGN_SPEED, timeout=None,
+                      direction=1, max_distance=ALIGN_MAX_DISTANCE):
+    """
+    Выравнивание по линии двумя датчиками
     
+    Каждое колесо едет, пока его датчик не покажет чёрное (ниже
+    black_threshold ALIGN_CONFIRM тактов подряд, без возврата выше
+    white_threshold). Подъезд - на speed,
+    у линии колесо замедляется по отражению (align_speed).
+    direction=-1 - назад. Не нашли линию за max_distance или timeout
+    (по умолчанию - время проезда max_distance на speed плюс
+    ALIGN_TIMEOUT) - останавливаемся.
     
+    Колесо, которое встало первым, - ось поворота, и его датчик (впереди
+    оси) уходит глубже в линию: колёса одни не выравнивают робот. Поэтому
+    линия находится по точкам касания датчиков (поза одометрии), и
+    остаток перекоса больше ALIGN_ACCURACY доворачивается по гироскопу.
+    Курс-цель - перпендикуляр к линии.
     
-
-
-def mission_4():
-    rotate(motor_b, -36, min_speed=50, max_speed=100)
-    gyro_straight_accel(195, accel=200, decel=100, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(-45, accuracy=2)
-    gyro_straight_accel(490, accel=200, decel=100, min_speed=100, max_speed=600, end_speed=80, gain=5.0)
-    rotate(motor_b, 70, min_speed=50, max_speed=1000)
-    gyro_back(420, speed=500, gain=5.0)
-    wait(200)
-    # rotate(motor_b, -90, min_speed=50, max_speed=700)
-    # wait(200)
-    # gyro_back(420, speed=500, gain=5.0)
-    rotate(motor_b, -90, min_speed=50, max_speed=700)
-    gyro_straight_accel(80, accel=200, decel=100, min_speed=100, max_speed=500, end_speed=80, gain=5.0)
-
-    gyro_straight_accel(230, accel=20, decel=10, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(-20, accuracy=2)
-    gyro_turn(20, accuracy=2)
+    Returns:
+        {"time": мс, "approach": перекос робота к линии на подъезде, °,
+         "skew": перекос после выравнивания, °, "missed": линия не найдена}
+        Перекосы - курс гироскопа против перпендикуляра к линии.
+    """
+    global target_heading
+    if timeout is None:
+        timeout = max_distance * 1000 // speed + ALIGN_TIMEOUT
+    start_left = left_motor.angle()
+    start_heading = get_heading()
+    spot_left = spot_right = None
+    left_count = right_count = 0
+    left_done = right_done = False
+    last_left, last_right = read_reflections(sensor_left, sensor_right)
+    missed = False
+    
+    watch = StopWatch()
+    while True:
+        left_val, right_val = read_reflections(sensor_left, sensor_right)
+        
+        if not left_done:
+            if left_val < black_threshold[0]:
+                if not left_count:
+                    spot_left = sensor_spot(SENSOR_SPACING / 2)
+                left_count += 1
+                left_done = left_count >= ALIGN_CONFIRM
+            elif left_val > white_threshold[0]:
+                left_count = 0
+        
+        if not right_done:
+            if right_val < black_threshold[1]:
+                if not right_count:
+                    spot_right = sensor_spot(-SENSOR_SPACING / 2)
+                right_count += 1
+                right_done = right_count >= ALIGN_CONFIRM
+            elif right_val > white_threshold[1]:
+                right_count = 0
+        
+        if left_done and right_done:
+            break
+        if watch.time() > timeout or (left_motor.angle() - start_left) * direction > max_distance:
+            missed = True
+            break
+        
+        left_speed = 0 if left_done else align_speed(left_val, last_left, speed, 0)
+        right_speed = 0 if right_done else align_speed(right_val, last_right, speed, 1)
+        drive(direction * left_speed, direction * right_speed)
+        last_left, last_right = left_val, right_val
+        yield
     
+    brake_wheels()
+    yield from wait_stopped()
     
+    stats = {"time": 0, "approach": 0, "skew": 0, "missed": missed}
+    if missed or not ODOMETRY:
+        settle_heading()
+    else:
+        normal = line_normal(spot_left, spot_right, get_heading())
+        if abs(get_heading() - normal) > ALIGN_ACCURACY:
+            yield from turn_toward(normal, ALIGN_ACCURACY)
+            brake_wheels()
+            yield from wait_stopped()
+        target_heading = normal
+        stats["approach"] = start_heading - normal
+        stats["skew"] = get_heading() - normal
+    stats["time"] = watch.time()
+    align_log.append(stats)
+    return stats
+
+
+@Primitive
+def align_two_sensors_back(sensor_left, sensor_right, speed=ALIGN_SPEED, timeout=None,
+                           max_distance=ALIGN_MAX_DISTANCE):
+    """Выравнивание по линии НАЗАД двумя датчиками (align_two_sensors с direction=-1)"""
+    return (yield from align_two_sensors.gen(sensor_left, sensor_right, speed, timeout, -1, max_distance))
 
 
-def mission_5():
-    gyro_straight_accel(810, accel=40, decel=100, min_speed=100, max_speed=700, end_speed=80, gain=5.0)
-    # Tap-tap-tap-tap
-    rotate(motor_b, -140, min_speed=500, max_speed=1000)
-    wait(70)
-    rotate(motor_b, 120, min_speed=500, max_speed=500)
-    wait(70)
-    rotate(motor_b, -120, min_speed=500, max_speed=1000)
-    wait(70)
-    rotate(motor_b, 120, min_speed=500, max_speed=500)
-    wait(70)
-    rotate(motor_b, -120, min_speed=500, max_speed=1000)
-    wait(70)
-    rotate(motor_b, 120, min_speed=500, max_speed=500)
-    wait(70)
-    rotate(motor_b, -120, min_speed=500, max_speed=1000)
-    wait(70)
-    rotate(motor_b, 120, min_speed=500, max_speed=500)
-    # Tap-tap-tap-tap Final
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ЕЗДА ПО ЛИНИИ
+# ═══════════════════════════════════════════════════════════════════════════════
 
-    gyro_back(120, speed=1000, gain=5.0)
-    gyro_turn(-90, accuracy=2)
-    gyro_straight_accel(120, accel=20, decel=40, min_speed=100, max_speed=900, end_speed=80, gain=5.0)
-    gyro_turn(90, 2)
-    wait(200)
-    gyro_straight_accel(780, accel=20, decel=40, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    rotate(motor_b, -150, min_speed=50, max_speed=1000)
-    wait(200)
-    gyro_turn(-20, accuracy=2)
-    gyro_back(20, 100, 4.0)
-    wait(200)
-    gyro_turn(70, accuracy=2)
-    rotate(motor_b, 120, min_speed=500, max_speed=500)
-    
-    #/////////////////////////////////////////////
-    rotate(motor_f, 100, 70, 1000)
-    gyro_straight(150, 100, 5.0)
-    gyro_turn(20, 2)
-    gyro_straight(50, 400, 4.0)
-    gyro_turn(-20, 2)
-    rotate(motor_f, -150, 100, 1000)
-    gyro_back_accel(150, accel=20, decel=50, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    gyro_turn(-80, 2)
-    gyro_straight_accel(430, accel=20, decel=10, min_speed=100, max_speed=1000, end_speed=80, gain=5.0)
-    
+# PD по отражению. Поправка колёс, как в heading_hold, пропорциональна
+# скорости: на любой скорости робот возвращается к линии за тот же путь.
+LINE_KP = 2.0           # град/с колеса на единицу отражения при LINE_REF_SPEED
+LINE_KD = 8.0           # на изменение ошибки за такт
+LINE_REF_SPEED = 400    # град/с
+LINE_JUNCTION_CONFIRM = 2   # тактов на чёрном - перекрёсток
 
+# Боковая ошибка последнего такта езды по линии (для телеметрии)
+line_error = 0
 
 
+@Primitive
+def follow_line(distance_degrees, sensor=None, edge=1, accel=200, decel=200,
+                min_speed=100, max_speed=500, end_speed=100, kp=LINE_KP, kd=LINE_KD,
+                junction=False):
+    """
+    Езда по линии: PD по отражению и трапеция скорости по пути
+    
+    sensor=None - линия между двумя датчиками, ошибка - разница их
+    отражений (каждое - от края линии своего датчика, line_edge).
+    sensor=sensor_left или sensor_right - по краю линии одним датчиком:
+    edge=1 - чёрное слева от датчика, -1 - справа.
+    
+    Заканчивается через distance_degrees (с предсказанием доката, как
+    прямые), а при junction=True - раньше, на перекрёстке: оба датчика
+    на чёрном (с одним датчиком - второй). После езды курс-цель миссии -
+    фактический курс.
+    
+    Пример:
+        follow_line(900, junction=True)             # до перекрёстка, не дальше 900°
+        follow_line(600, sensor_left, edge=-1, max_speed=700)
+    
+    Returns:
+        {"distance": град, "junction": нашли перекрёсток,
+         "error": (средняя |ошибка|, наибольшая), "time": мс}
+    """
+    global line_error
+    profile = compile_profile(distance_degrees, accel, decel, min_speed, max_speed, end_speed)
+    origin = left_motor.angle()
+    last_error = None
+    black = 0
+    found = False
+    total = peak = ticks = 0
+    watch = StopWatch()
+    
+    while True:
+        progress = left_motor.angle() - origin
+        if brake_point(progress, distance_degrees):
+            break
+        
+        left_val, right_val = read_reflections()
+        left_black = left_val < black_threshold[0]
+        right_black = right_val < black_threshold[1]
+        if sensor is None:
+            error = (left_val - line_edge[0]) - (right_val - line_edge[1])
+            crossing = left_black and right_black
+            leaving = left_val > white_threshold[0] or right_val > white_threshold[1]
+        elif sensor is sensor_left:
+            error = (line_edge[0] - left_val) * edge
+            crossing = right_black
+            leaving = right_val > white_threshold[1]
+        else:
+            error = (line_edge[1] - right_val) * edge
+            crossing = left_black
+            leaving = left_val > white_threshold[0]
+        
+        if junction:
+            if crossing:
+                black += 1
+                if black >= LINE_JUNCTION_CONFIRM:
+                    found = True
+                    break
+            elif leaving:
+                black = 0
+        
+        line_error = error
+        total += abs(error)
+        peak = max(peak, abs(error))
+        ticks += 1
+        
+        if last_error is None:
+            last_error = error
+        speed = profile.speed(progress)
+        correction = (kp * error + kd * (error - last_error)) * speed / LINE_REF_SPEED
+        last_error = error
+        drive(speed + correction, speed - correction)
+        yield
+    
+    # На перекрёстке ошибка остановки в brake_log - докат от него
+    stop_straight(progress, progress if found else distance_degrees, 1)
+    line_error = 0
+    yield from wait_stopped()
+    settle_heading()
+    return {"distance": progress, "junction": found,
+            "error": (total / ticks if ticks else 0, peak), "time": watch.time()}
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+#                         ТАБЛИЦЫ МИССИЙ
+# ═══════════════════════════════════════════════════════════════════════════════
 
+# Миссия - кортеж шагов (опкод, аргументы...). Строка-имя профиля среди
+# аргументов подставляет его параметры, словарь - поправки к ним:
+#     ("fwd", 300, "cruise", {"max_speed": 700})
+#     = gyro_straight_accel(300, accel=200, decel=300, min_speed=100,
+#                           max_speed=700, end_speed=80, gain=5.0)
+# Сегменты пути - такие же кортежи внутри ("path", ...):
+#     ("path", ("fwd", 170, "soft"), ("turn", -70, 2))
+# Фоновый шаг - ("start", опкод, аргументы...), дождаться всех - ("join",).
+
+PROFILES = {
+    "cruise": {"accel": 200, "decel": 300, "min_speed": 100, "max_speed": 1000, "end_speed": 80, "gain": 5.0},
+    "quick": {"accel": 200, "decel": 200, "min_speed": 150, "max_speed": 1000, "end_speed": 80, "gain": 5.0},
+    "short": {"accel": 200, "decel": 100, "min_speed": 100, "max_speed": 1000, "end_speed": 80, "gain": 5.0},
+    "long": {"accel": 20, "decel": 40, "min_speed": 100, "max_speed": 1000, "end_speed": 80, "gain": 5.0},
+    "gentle": {"accel": 100, "decel": 100, "min_speed": 80, "max_speed": 700, "end_speed": 60},
+    "soft": {"accel": 20, "decel": 20, "min_speed": 80, "max_speed": 1000, "end_speed": 60},
+    # S-кривая: плавный разгон до предела мотора
+    "smooth": {"min_speed": 100, "max_speed": 1000, "end_speed": 80, "gain": 5.0,
+               "jerk": S_CURVE_JERK, "max_accel": S_CURVE_ACCEL},
+}
+
+# Опкод -> имя примитива. Имя ищется в globals() при вызове, поэтому
+# подменённые примитивы (замер шагов в sim/) работают и для таблиц.
+OPS = {
+    "fwd": "gyro_straight_accel",
+    "back": "gyro_back_accel",
+    "fwd_speed": "gyro_straight",
+    "back_speed": "gyro_back",
+    "turn": "gyro_turn",
+    "face": "turn_to",
+    "drift": "drift",
+    "arm": "rotate",
+    "wait": "pause",
+    "path": "follow_path",
+    "align": "align_two_sensors",
+    "align_back": "align_two_sensors_back",
+    "line": "follow_line",
+    "goto": "go_to",
+    "pose": "set_pose",
+    "join": "join_all",
+}
+
+# Опкоды сегментов внутри ("path", ...)
+SEGMENTS = {
+    "fwd": "straight",
+    "back": "back",
+    "arc": "arc",
+    "turn": "turn",
+    "face": "face",
+}
+
+LOG_STEPS = False  # печатать время каждого шага таблицы
+
+# (номер шага, опкод, мс) последней миссии (очищается в launch)
+step_log = []
+
+
+def _resolve(step, table=OPS):
+    """Шаг таблицы -> (функция, позиционные аргументы, именованные)"""
+    func = globals()[table[step[0]]]
+    args = []
+    kwargs = {}
+    for value in step[1:]:
+        if type(value) is str and value in PROFILES:
+            kwargs.update(PROFILES[value])
+        elif type(value) is dict:
+            kwargs.update(value)
+        else:
+            args.append(value)
+    return func, args, kwargs
 
 
+def _run_step(step):
+    if step[0] == "start":
+        func, args, kwargs = _resolve(step[1:])
+        return start(func, *args, **kwargs)
+    func, args, kwargs = _resolve(step)
+    if step[0] == "path":
+        segments = []
+        for segment in args:
+            build, segment_args, segment_kwargs = _resolve(segment, SEGMENTS)
+            segments.append(build(*segment_args, **segment_kwargs))
+        args = segments
+    return func(*args, **kwargs)
 
 
+def execute(steps):
+    """
+    Выполняет таблицу миссии по шагам
 
+    Перед каждым шагом - опрос кнопки остановки, после - время шага
+    в step_log (и в консоль при LOG_STEPS).
+    """
+    watch = StopWatch()
+    for i, step in enumerate(steps):
+        check_stop(force=True)
+        watch.reset()
+        _run_step(step)
+        ms = watch.time()
+        step_log.append((i, step[0], ms))
+        if LOG_STEPS:
+            print("step", i + 1, step[0], ms, "ms")
 
-def mission_6():
-    drift(960, -0.35, 700, True)
 
+# ═══════════════════════════════════════════════════════════════════════════════
+#                              МИССИИ
+# ═══════════════════════════════════════════════════════════════════════════════
 
-def mission_7():
-    pass
+mission_1 = (
+    ("fwd", 1400, "cruise"),
+    ("turn", -50, 3),
+    ("fwd", 340, "cruise"),
+    ("arm", motor_b, -70, 50, 1000),
+    ("back_speed", 200, 100, 1.0),
+    ("turn", 51, 3),  # +1° от убранной пары поправок 6/-5
+    ("back", 700, "gentle"),
+    ("turn", 85, 3),
+    ("back_speed", 140, 1000, 5.0),
+    ("drift", 700, -3, 300, True),
+    ("wait", 300),
+    ("turn", 100, 3),
+    ("fwd", 300, "cruise", {"max_speed": 700}),
+    ("turn", -105, 3),
+    ("back_speed", 470, 1000, 5.0),
+
+    # ("fwd", 600, "cruise", {"accel": 20, "decel": 30, "max_speed": 700}),
+    # ("arm", motor_b, 60, 50, 1000),
+    # ("wait", 500),
+    # ("back_speed", 470, 1000, 5.0),
+    # ("turn", 40, 3),
+    # ("back_speed", 470, 1000, 5.0),
+)
+
+
+mission_2 = (
+    ("fwd", 500, "quick"),
+    ("turn", 90, 2),
+    ("turn", -90, 2),
+    ("back", 600, "quick"),
+)
+
+
+mission_3 = (
+    ("path",
+        ("fwd", 1100, "quick", {"max_speed": 650}),
+        ("back", 160, "gentle", {"max_speed": 800}),
+        ("turn", -40, 2),
+        ("fwd", 170, "quick", {"decel": 140, "max_speed": 700}),
+    ),
+    ("drift", 450, -3, 1000, False),
+    ("wait", 100),
+    ("path",
+        ("turn", -50, 2),
+        ("fwd", 250, "quick", {"accel": 10, "decel": 30}),
+        ("turn", 40, 2),
+        ("fwd", 30, {"accel": 0, "decel": 0, "max_speed": 600, "end_speed": 600, "gain": 5.0}),
+    ),
+    ("align", sensor_left, sensor_right),
+    #///////////////////////
+    ("wait", 200),
+    ("back_speed", 50, 900, 4.0),
+    ("turn", 25),
+    ("back_speed", 190, 900, 4.0),
+    ("arm", motor_f, 90, 70, 250),
+    ("wait", 100),
+    ("turn", 30, 2),
+    ("fwd_speed", 15, 400, 4.0),
+    ("arm", motor_f, 100, 50, 250),
+    ("turn", -60),
+    ("fwd_speed", 180, 400, 4.0),
+
+    ("align", sensor_left, sensor_right),
+    #////////////////////////
+    ("wait", 200),
+    ("turn", 25),
+    ("fwd", 300, "gentle", {"decel": 150, "max_speed": 1000}),
+
+    ("turn", -35, 2),
+    ("drift", 570, -0.4, 700, True),
+    ("arm", motor_b, 300, 700, 1000),
+    ("turn", -3, 2),
+    ("arm", motor_b, 3000, 700, 1000),
+    ("arm", motor_b, -600, 800, 1000),
+
+    ("path",
+        ("turn", -60, 2),
+        ("fwd", 50, "soft", {"accel": 10, "decel": 10}),
+        ("turn", 80, 2),
+        ("fwd", 130, {"accel": 0, "decel": 0, "max_speed": 500, "end_speed": 500, "gain": 4.0}),
+        ("turn", 50, 2),
+        ("back", 50, "soft"),
+        ("turn", 45, 2),
+        ("back", 300, "soft"),
+    ),
+
+    ("arm", motor_f, -180, 900, 1000),
+    ("start", "arm", motor_f, 180, 900, 1000),  # рука возвращается на ходу
+    ("path",
+        ("fwd", 170, "soft"),
+        ("turn", -70, 2),
+        ("fwd", 1400, "soft", {"accel": 50, "decel": 50}),
+    ),
+    ("join",),
+)
+
+
+mission_4 = (
+    ("arm", motor_b, -36, 50, 100),
+    ("fwd", 195, "short"),
+    ("turn", -45, 2),
+    ("fwd", 490, "short", {"max_speed": 600}),
+    ("arm", motor_b, 70, 50, 1000),
+    ("back_speed", 420, 500, 5.0),
+    ("wait", 200),
+    # ("arm", motor_b, -90, 50, 700),
+    # ("wait", 200),
+    # ("back_speed", 420, 500, 5.0),
+    ("arm", motor_b, -90, 50, 700),
+    ("fwd", 80, "short", {"max_speed": 500}),
+
+    ("fwd", 230, "long", {"decel": 10}),
+    ("turn", -20, 2),
+    ("turn", 20, 2),
+)
+
+
+# Tap-tap-tap-tap: рука вниз-вверх
+TAP = (
+    ("arm", motor_b, 120, 500, 500),
+    ("wait", 70),
+    ("arm", motor_b, -120, 500, 1000),
+    ("wait", 70),
+)
+
+mission_5 = (
+    ("fwd", 810, "long", {"accel": 40, "decel": 100, "max_speed": 700}),
+    ("arm", motor_b, -140, 500, 1000),
+    ("wait", 70),
+) + TAP * 3 + (
+    ("arm", motor_b, 120, 500, 500),
+    # Tap-tap-tap-tap Final
 
+    ("path",
+        ("back", 120, {"accel": 0, "decel": 0, "max_speed": 1000, "end_speed": 1000, "gain": 5.0}),
+        ("turn", -90, 2),
+        ("fwd", 120, "long", {"max_speed": 900}),
+        ("turn", 90, 2),
+    ),
+    ("wait", 200),
+    ("fwd", 780, "long"),
+    ("arm", motor_b, -150, 50, 1000),
+    ("wait", 200),
+    ("turn", -20, 2),
+    ("back_speed", 20, 100, 4.0),
+    ("wait", 200),
+    ("turn", 70, 2),
+    ("arm", motor_b, 120, 500, 500),
 
-def mission_8():
-    pass
+    #/////////////////////////////////////////////
+    ("arm", motor_f, 100, 70, 1000),
+    ("fwd_speed", 150, 100, 5.0),
+    ("turn", 20, 2),
+    ("fwd_speed", 50, 400, 4.0),
+    ("turn", -20, 2),
+    ("start", "arm", motor_f, -150, 100, 1000),  # рука поднимается на ходу
+    ("path",
+        ("back", 150, "long", {"decel": 50}),
+        ("turn", -80, 2),
+        ("fwd", 430, "long", {"decel": 10}),
+    ),
+    ("join",),
+)
+
+
+mission_6 = (
+    ("drift", 960, -0.35, 700, True),
+)
+
+
+mission_7 = ()
+
+
+mission_8 = ()
+
+
+def launch(mission):
+    """Выполняет миссию (таблицу шагов или функцию) и дожидается её фоновых задач"""
+    try:
+        arm_stop()
+        if telemetry:
+            telemetry.start()
+        reset_heading(0)
+        set_pose(0, 0)
+        del turn_log[:]
+        del step_log[:]
+        del brake_log[:]
+        del align_log[:]
+        del battery_log[:]
+        del slip_log[:]
+        read_battery()
+        if callable(mission):
+            mission()
+        else:
+            execute(mission)
+        join_all()
+    except:
+        cancel_all()
+        raise
 
 
 missions = [mission_1, mission_2, mission_3, mission_4, mission_5, mission_6, mission_7, mission_8]
+
+# Калибровки - в меню после миссий, на экране буквой:
+#   L - датчики отражения (на белом перед чёрной линией)
+#   B - торможение (свободно ~15 см впереди и сзади)
+calibrations = [("L", calibrate_reflection), ("G", calibrate_gyro), ("B", calibrate_brake)]
 current = 0
 
 
@@ -703,7 +2660,17 @@ current = 0
 #                           МЕНЮ
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def selected():
+    """Выбранный пункт меню: миссия или калибровка"""
+    if current < len(missions):
+        return missions[current]
+    return calibrations[current - len(missions)][1]
+
+
 def show_num():
+    if current >= len(missions):
+        hub.display.char(calibrations[current - len(missions)][0])
+        return
     num = current + 1
     if num <= 9:
         hub.display.char(str(num))
@@ -711,47 +2678,169 @@ def show_num():
         hub.display.char(str(num % 10))
 
 
-hub.light.on(Color.BLUE)
-show_num()
-hub.speaker.beep(800, 100)
+# ═══════════════════════════════════════════════════════════════════════════════
+#                           ЗАБЕГ
+# ═══════════════════════════════════════════════════════════════════════════════
 
-while True:
-    # Ждём отпускания кнопок
-    while hub.buttons.pressed():
-        wait(20)
+# Миссии матча идут в порядке RUN_ORDER: после успешной следующая
+# выбирается сама, оператору остаётся одно нажатие CENTER - или, при
+# BASE_TRIGGER, просто поставить робота в базу (датчик BASE_SENSOR видит
+# подъём робота и его возвращение на поле). Время матча идёт с запуска
+# первой миссии порядка; между миссиями номер следующей на экране
+# сменяется полосой прошедшего времени (25 точек на MATCH_TIME), после
+# бюджета подсветка красная. Сплиты - в run_log и в консоль.
+RUN_ORDER = (1, 2, 3, 4, 5, 6)  # номера миссий матча
+MATCH_TIME = 150000     # мс - 2:30
+RUN_BLINK = (1200, 600) # мс: номер миссии, полоса времени
+MENU_POLL = 10          # мс - опрос кнопок в меню
+BASE_TRIGGER = False    # запуск миссии, когда робота поставили в базу
+BASE_SENSOR = sensor_right
+BASE_LIFTED = 5         # отражение ниже - робот поднят, датчик смотрит в воздух
+BASE_SETTLE = 500       # мс на поле после подъёма - запуск
+
+match_watch = StopWatch()
+match_started = False
+
+# (номер миссии, начало от старта матча мс, длительность мс, итог) -
+# очищается при запуске первой миссии RUN_ORDER
+run_log = []
+
+
+def show_time():
+    """Полоса прошедшего времени матча: одна точка - MATCH_TIME / 25"""
+    lit = min(25, match_watch.time() * 25 // MATCH_TIME)
+    hub.display.off()
+    for i in range(lit):
+        hub.display.pixel(i // 5, i % 5, 100)
+
+
+def idle_light():
+    """Подсветка в меню: синяя, после бюджета матча - красная"""
+    over = match_started and match_watch.time() > MATCH_TIME
+    hub.light.on(Color.RED if over else Color.BLUE)
+
+
+def wait_press():
+    """
+    Ждёт нового нажатия кнопок (сначала - отпускания) и возвращает их
     
-    # Ждём нажатия
-    pressed = set()
-    while not pressed:
+    В матче тем временем мигает номер миссии и полоса времени. При
+    BASE_TRIGGER робот, поднятый и поставленный на поле на BASE_SETTLE
+    мс, - то же, что CENTER.
+    """
+    while hub.buttons.pressed():
+        wait(MENU_POLL)
+    watch = StopWatch()
+    lifted = False
+    placed = None
+    showing_time = False
+    while True:
         pressed = hub.buttons.pressed()
-        wait(20)
+        if pressed:
+            if showing_time:
+                show_num()
+            return pressed
+        now = watch.time()
+        
+        if match_started:
+            phase = now % (RUN_BLINK[0] + RUN_BLINK[1]) >= RUN_BLINK[0]
+            if phase != showing_time:
+                showing_time = phase
+                if phase:
+                    show_time()
+                else:
+                    show_num()
+                    idle_light()
+        
+        if BASE_TRIGGER and current < len(missions):
+            if BASE_SENSOR.reflection() < BASE_LIFTED:
+                lifted = True
+                placed = None
+            elif lifted:
+                if placed is None:
+                    placed = now
+                elif now - placed >= BASE_SETTLE:
+                    if showing_time:
+                        show_num()
+                    return {Button.CENTER}
+        wait(MENU_POLL)
+
+
+def run_selected():
+    """
+    Запускает выбранный пункт меню; миссия из RUN_ORDER - со сплитом,
+    после успеха выбирается следующая миссия порядка
+    
+    Returns:
+        "done" | "stopped" | "error"
+    """
+    global current, match_started
+    number = current + 1 if current < len(missions) else None
+    in_order = number in RUN_ORDER
+    if in_order and number == RUN_ORDER[0]:
+        match_watch.reset()
+        match_started = True
+        del run_log[:]
+    begin = match_watch.time()
     
-    wait(100)
+    try:
+        launch(selected())
+        result = "done"
+    except StopMission:
+        result = "stopped"
+    except Exception as e:
+        print("mission", number, "error", e)
+        result = "error"
     
-    if Button.LEFT in pressed:
-        current = (current - 1) % len(missions)
-        show_num()
+    if in_order and match_started:
+        split = match_watch.time() - begin
+        run_log.append((number, begin, split, result))
+        print("run mission", number, result, "split", split, "ms, match",
+              match_watch.time(), "/", MATCH_TIME, "ms")
+        position = RUN_ORDER.index(number)
+        if result == "done" and position + 1 < len(RUN_ORDER):
+            current = RUN_ORDER[position + 1] - 1
+    return result
+
+
+# При запуске на хабе программа - __main__; симулятор (sim/) импортирует её
+# как модуль и сам вызывает миссии
+if __name__ == "__main__":
+    if BENCHMARK:
+        bench_profile()
+    current = RUN_ORDER[0] - 1
+    hub.light.on(Color.BLUE)
+    show_num()
+    hub.speaker.beep(800, 100)
+
+    while True:
+        pressed = wait_press()
+    
+        if Button.LEFT in pressed:
+            current = (current - 1) % (len(missions) + len(calibrations))
+            show_num()
         
-    elif Button.RIGHT in pressed:
-        current = (current + 1) % len(missions)
-        show_num()
+        elif Button.RIGHT in pressed:
+            current = (current + 1) % (len(missions) + len(calibrations))
+            show_num()
         
-    elif Button.CENTER in pressed:
-        hub.light.on(Color.GREEN)
-        hub.speaker.beep(600, 100)
+        elif Button.CENTER in pressed:
+            hub.light.on(Color.GREEN)
+            hub.speaker.beep(600, 100)
         
-        try:
-            missions[current]()
-            # Успех
-            hub.speaker.beep(1000, 200)
-        except StopMission:
-            # Остановлено пользователем - оранжевый сигнал
-            hub.light.on(Color.ORANGE)
-            hub.speaker.beep(500, 300)
-            wait(300)
-        except:
-            # Другая ошибка
-            hub.speaker.beep(200, 500)
+            result = run_selected()
+            if result == "done":
+                hub.speaker.beep(1000, 200)
+                if telemetry and TELEMETRY_DUMP:
+                    telemetry.dump()
+            elif result == "stopped":
+                # Остановлено пользователем - оранжевый сигнал
+                hub.light.on(Color.ORANGE)
+                hub.speaker.beep(500, 300)
+                wait(300)
+            else:
+                # Другая ошибка
+                hub.speaker.beep(200, 500)
         
-        hub.light.on(Color.BLUE)
-        show_num()
+            idle_light()
+            show_num()